@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone, date
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+#Local stand-in for the Snipe-IT and Smartsheet endpoints used by Project Tulips and Project Reliquery.
+#Snipe-IT lives under /api/v1 and Smartsheet under /2.0, so the scripts only need their base urls changed.
+
+#Column ids of the generated sheets, in IT_Row field order.
+COLUMN_FIELDS = ["hire_date", "first_name", "last_name", "title", "office", "pmail"]
+HR_COLUMN_IDS = [101, 102, 103, 104, 105, 106]
+IT_COLUMN_IDS = [201, 202, 203, 204, 205, 206]
+IT_EXTRA_COLUMN_ID = 207 #A notes column the scripts don't know about.
+HR_SHEET_ID = 1
+IT_SHEET_ID = 2
+ARCHIVE_SHEET_ID = 3
+#Extra HR/IT/archive sheet sets built with --pairs have their sheet and column ids offset by these steps per pair.
+PAIR_SHEET_STEP = 10
+PAIR_COLUMN_STEP = 1000
+
+COLORS = [5, 8, 9]
+STATUS_METAS = ["deployed"] * 7 + ["archived", "deployable", "pending", "undeployable"]
+#Snipe-IT's ?status= filter values and the status_meta they select.
+STATUS_FILTERS = {"rtd": "deployable", "deployed": "deployed", "archived": "archived", "pending": "pending", "undeployable": "undeployable"}
+ACTION_TYPES = ["checkout", "checkin from", "update"]
+LOCATION_KEYS = ("toTop", "toBottom", "siblingId")
+
+#Settings for one mock run, all of them can be changed through /_reset.
+class MockConfig(object):
+    """Init Constructor"""
+    def __init__(self, assets = 1000, activity = 1000, activity_days = 30, hr_rows = 1000, it_rows = 800,
+                 latency = 0.0, rate_limit = 0, max_page_size = 500, seed = 1, filters = 1, etags = 1, pairs = 1):
+        self.assets = assets
+        self.activity = activity
+        self.activity_days = activity_days
+        self.hr_rows = hr_rows
+        self.it_rows = it_rows
+        self.latency = latency #Seconds added to every api call.
+        self.rate_limit = rate_limit #Api calls allowed per second, 0 for no limit.
+        self.max_page_size = max_page_size #Largest limit Snipe-IT will honour.
+        self.seed = seed
+        self.filters = filters #0 ignores Snipe-IT's status and action_type filters, like an older server.
+        self.etags = etags #0 leaves ETag off Snipe-IT responses and ignores If-None-Match.
+        self.pairs = pairs #HR/IT/archive sheet sets, the first uses the ids above and the rest come from pair_ids.
+
+    #Applies query string overrides such as ?assets=10000&latency=0.05
+    def update(self, query):
+        for name, values in query.items():
+            if hasattr(self, name):
+                setattr(self, name, type(getattr(self, name))(values[0]))
+
+#Sheet and column ids of one HR/IT/archive sheet set, pair 0 being the default one.
+def pair_ids(pair):
+    return {
+        "hr_sheet": HR_SHEET_ID + PAIR_SHEET_STEP * pair,
+        "it_sheet": IT_SHEET_ID + PAIR_SHEET_STEP * pair,
+        "archive_sheet": ARCHIVE_SHEET_ID + PAIR_SHEET_STEP * pair,
+        "hr_columns": [column_id + PAIR_COLUMN_STEP * pair for column_id in HR_COLUMN_IDS],
+        "it_columns": [column_id + PAIR_COLUMN_STEP * pair for column_id in IT_COLUMN_IDS],
+        "it_extra_column": IT_EXTRA_COLUMN_ID + PAIR_COLUMN_STEP * pair
+    }
+
+#Timestamp in the format Smartsheet uses for modifiedAt.
+def timestamp():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+#Holds the generated datasets and every counter the benchmark reads back.
+class MockState(object):
+    """Init Constructor"""
+    def __init__(self, config):
+        self.lock = threading.RLock() #Sheet edits hold it while the response is sent.
+        self.config = config
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.bytes_sent = 0
+        self.rate_limited = 0
+        self.next_row_id = 10 ** 9
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.build()
+
+    def new_row_id(self):
+        self.next_row_id += 1
+        return self.next_row_id
+
+    def build(self):
+        config = self.config
+        rnd = random.Random(config.seed)
+        now = datetime.now()
+        self.assets = [
+            {
+                "id": i,
+                "name": f"Asset {i}",
+                "asset_tag": f"{i:06d}",
+                "serial": f"SN{rnd.randrange(10 ** 8):08d}",
+                "model": {"name": rnd.choice(["Latitude ", "ThinkPad ", "MacBook "])},
+                "model_number": rnd.choice(["5440", "T14", "Pro 14"]),
+                "status_label": {"status_meta": rnd.choice(STATUS_METAS)},
+                #Assets come in batches of five, so created_at goes up with the id and has ties.
+                "created_at": {"datetime": (now - timedelta(hours = config.assets - i // 5)).strftime('%Y-%m-%d %H:%M:%S')}
+            }
+            for i in range(1, config.assets + 1)
+        ]
+        #Activity is newest first, spread evenly over activity_days.
+        step = timedelta(days = config.activity_days) / max(config.activity, 1)
+        self.activity = [
+            {
+                "id": config.activity - i,
+                "item": {"id": rnd.randint(600, 1500), "name": f"Asset {rnd.randint(1, max(config.assets, 1))}"},
+                "action_type": rnd.choice(ACTION_TYPES),
+                "action_date": {"datetime": (now - step * i).strftime('%Y-%m-%d %H:%M:%S')}
+            }
+            for i in range(config.activity)
+        ]
+        self.sheets = {}
+        for pair in range(max(1, config.pairs)):
+            self.build_sheets(rnd, pair_ids(pair))
+
+    #HR and IT sheets that overlap on pmail, with some date mismatches, rows to archive, and rows to create and delete.
+    def build_sheets(self, rnd, ids):
+        config = self.config
+        it_columns = ids["it_columns"] + [ids["it_extra_column"]]
+        today = date.today()
+        people = [(f"First{i}", f"Last{i}", rnd.choice(["Engineer", "Analyst", "Manager"]), rnd.choice(["NYC", "SFO", "AUS"]), f"person{i}@example.com")
+                  for i in range(config.hr_rows + config.it_rows)]
+        hr_rows = []
+        for i in range(config.hr_rows):
+            hire_date = (today + timedelta(days = rnd.randint(-30, 45))).isoformat()
+            hr_rows.append(self.make_row(ids["hr_columns"], [hire_date, *people[i]]))
+        it_rows = []
+        offset = config.hr_rows // 4
+        for i in range(config.it_rows):
+            person = offset + i
+            hire_date = (today + timedelta(days = rnd.randint(-30, 45))).isoformat()
+            if person < config.hr_rows and rnd.random() < 0.9:
+                hr_date = hr_rows[person]['cells'][0]['value']
+                hire_date = hr_date if rnd.random() < 0.9 else hire_date
+            values = [hire_date, *people[person], "note" if rnd.random() < 0.3 else None]
+            it_rows.append(self.make_row(it_columns, values, f",,,,,,2,,,{rnd.choice(COLORS)},,,,,,"))
+        self.add_sheet(ids["hr_sheet"], ids["hr_columns"], hr_rows)
+        self.add_sheet(ids["it_sheet"], it_columns, it_rows)
+        self.add_sheet(ids["archive_sheet"], it_columns, [])
+
+    def add_sheet(self, sheet_id, column_ids, rows):
+        self.sheets[sheet_id] = {
+            "id": sheet_id,
+            "version": 1,
+            "columns": [{"id": column_id, "index": index, "title": f"Column {column_id}"} for index, column_id in enumerate(column_ids)],
+            "rows": rows
+        }
+
+    def make_row(self, column_ids, values, row_format = None):
+        cells = []
+        for column_id, value in zip(column_ids, values):
+            cell = {"columnId": column_id}
+            if value not in (None, ""):
+                cell["value"] = value
+            if row_format:
+                cell["format"] = row_format
+            cells.append(cell)
+        return {"id": self.new_row_id(), "modifiedAt": timestamp(), "cells": cells}
+
+    #Counts a request and checks it against the rate limit. Returns False when it should get a 429.
+    def admit(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if not self.config.rate_limit:
+                return True
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start, self.window_count = now, 0
+            self.window_count += 1
+            if self.window_count > self.config.rate_limit:
+                self.rate_limited += 1
+                return False
+            return True
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "total_requests": sum(self.requests.values()),
+                    "bytes_sent": self.bytes_sent, "rate_limited": self.rate_limited}
+
+#Copy of a row without cell formats, like Smartsheet returns without ?include=format.
+def strip_formats(row):
+    return dict(row, cells = [{key: value for key, value in cell.items() if key != "format"} for cell in row['cells']])
+
+#Location specifier of a row in an add or update request, empty when it has none.
+def row_location(row):
+    return tuple((key, row[key]) for key in LOCATION_KEYS if key in row)
+
+#Value of a cell, used by the sort endpoint.
+def cell_value(row, column_id):
+    return next((cell.get('value') for cell in row['cells'] if cell['columnId'] == column_id), None)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body.strip() else None
+
+    def send_json(self, data, status = 200, extra_headers = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.bytes_sent += len(body)
+
+    def send_not_modified(self, etag):
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+    #Shared front door for every api call: counting, rate limiting and latency.
+    def api_call(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        endpoint = f"{method} {self.endpoint_name(url.path, query)}"
+        body = self.read_body() if method in ("POST", "PUT") else None
+        if not self.state.admit(endpoint):
+            return self.send_json({"errorCode": 4003, "message": "Rate limit exceeded."}, 429, {"Retry-After": "1"})
+        if self.state.config.latency:
+            time.sleep(self.state.config.latency)
+        if url.path.startswith("/api/v1/"):
+            return self.snipe_it(url.path[len("/api/v1"):], query)
+        match = re.match(r'/2\.0/sheets/(\d+)(/.*)?$', url.path)
+        if not match or int(match.group(1)) not in self.state.sheets:
+            return self.send_json({"errorCode": 1006, "message": "Not Found"}, 404)
+        with self.state.lock:
+            return self.smartsheet(method, self.state.sheets[int(match.group(1))], match.group(2) or "", query, body)
+
+    #Groups urls by endpoint, without ids, for the request counts.
+    def endpoint_name(self, path, query):
+        path = re.sub(r'/sheets/\d+', '/sheets/{id}', path)
+        path = re.sub(r'/rows/\d+', '/rows/{id}', path)
+        if 'rowsModifiedSince' in query:
+            path += "?rowsModifiedSince"
+        return path
+
+    def snipe_it(self, path, query):
+        state = self.state
+        if path == "/hardware":
+            rows = state.assets
+            if 'status' in query and state.config.filters:
+                status_meta = STATUS_FILTERS.get(query['status'][0].lower())
+                rows = [row for row in rows if row['status_label']['status_meta'] == status_meta]
+            #Snipe-IT lists assets newest first unless asked otherwise, ties go by id here.
+            if query.get('sort', ['created_at'])[0] == 'id':
+                key = lambda row: row['id']
+            else:
+                key = lambda row: (row['created_at']['datetime'], row['id'])
+            rows = sorted(rows, key = key, reverse = query.get('order', ['desc'])[0] == 'desc')
+        elif path == "/reports/activity":
+            rows = state.activity
+            if 'action_type' in query and state.config.filters:
+                rows = [row for row in rows if row['action_type'] == query['action_type'][0]]
+        else:
+            return self.send_json({"status": "error", "messages": "Not found"}, 404)
+        offset = int(query.get('offset', [0])[0])
+        limit = min(int(query.get('limit', [50])[0]), state.config.max_page_size)
+        data = {"total": len(rows), "rows": rows[offset:offset + limit]}
+        if not state.config.etags:
+            return self.send_json(data)
+        etag = '"' + hashlib.sha1(json.dumps(data).encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.send_not_modified(etag)
+        return self.send_json(data, extra_headers = {"ETag": etag})
+
+    def smartsheet(self, method, sheet, path, query, body):
+        if method == "GET":
+            if path == "/version":
+                return self.send_json({"version": sheet['version']})
+            include_format = 'format' in query.get('include', [''])[0]
+            if path.startswith("/rows/"):
+                row = next((row for row in sheet['rows'] if row['id'] == int(path.split('/')[2])), None)
+                if row is None:
+                    return self.send_json({"errorCode": 1006, "message": "Not Found"}, 404)
+                return self.send_json(row if include_format else strip_formats(row))
+            rows = sheet['rows']
+            numbered = [dict(row, rowNumber = number) for number, row in enumerate(rows, 1)]
+            if 'rowsModifiedSince' in query:
+                since = query['rowsModifiedSince'][0]
+                numbered = [row for row in numbered if row['modifiedAt'] >= since]
+            data = {key: value for key, value in sheet.items() if key != 'rows'}
+            data['totalRowCount'] = len(rows)
+            data['rows'] = numbered if include_format else [strip_formats(row) for row in numbered]
+            return self.send_json(data)
+
+        if method in ("POST", "PUT") and path.startswith("/rows") and isinstance(body, list) and len(set(map(row_location, body))) > 1:
+            return self.send_json({"errorCode": 1008, "message": "All rows in a request must have the same location."}, 400)
+        sheet['version'] += 1
+        if method == "POST" and path == "/rows":
+            return self.send_json({"message": "SUCCESS", "resultCode": 0, "result": self.add_rows(sheet, body)})
+        if method == "PUT" and path.startswith("/rows"):
+            updates = body if isinstance(body, list) else [dict(body, id = int(path.split('/')[2]))]
+            return self.send_json({"message": "SUCCESS", "resultCode": 0, "result": self.update_rows(sheet, updates)})
+        if method == "DELETE" and path == "/rows":
+            row_ids = {int(row_id) for row_id in query['ids'][0].split(',')}
+            sheet['rows'] = [row for row in sheet['rows'] if row['id'] not in row_ids]
+            return self.send_json({"message": "SUCCESS", "resultCode": 0, "result": sorted(row_ids)})
+        if method == "POST" and path == "/rows/move":
+            row_ids = {int(row_id) for row_id in body['rowIds']}
+            destination = self.state.sheets[int(body['to']['sheetId'])]
+            destination['rows'].extend(row for row in sheet['rows'] if row['id'] in row_ids)
+            destination['version'] += 1
+            sheet['rows'] = [row for row in sheet['rows'] if row['id'] not in row_ids]
+            return self.send_json({"message": "SUCCESS", "resultCode": 0})
+        if method == "POST" and path == "/sort":
+            self.sort_rows(sheet, body['sortCriteria'])
+            return self.send_json({"message": "SUCCESS", "resultCode": 0})
+        return self.send_json({"errorCode": 1006, "message": "Not Found"}, 404)
+
+    def add_rows(self, sheet, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        column_ids = [column['id'] for column in sheet['columns']]
+        created = []
+        for row in rows:
+            values = {int(cell['columnId']): cell.get('value') for cell in row['cells']}
+            new_row = self.state.make_row(column_ids, [values.get(column_id) for column_id in column_ids], row.get('format'))
+            self.place_row(sheet, new_row, row, created[-1] if created else None)
+            created.append(new_row)
+        return created
+
+    def update_rows(self, sheet, updates):
+        rows_by_id = {row['id']: row for row in sheet['rows']}
+        placed = None
+        for update in updates:
+            row = rows_by_id[int(update['id'])]
+            for change in update.get('cells', []):
+                cell = next(cell for cell in row['cells'] if cell['columnId'] == int(change['columnId']))
+                if change.get('value') in (None, ""):
+                    cell.pop('value', None)
+                else:
+                    cell['value'] = change['value']
+                if 'format' in change:
+                    cell['format'] = change['format']
+            row['modifiedAt'] = timestamp()
+            if row_location(update):
+                sheet['rows'].remove(row)
+                self.place_row(sheet, row, update, placed)
+                placed = row
+        return updates
+
+    #Puts a row where its location specifier says, at the bottom by default.
+    #Rows of one request share a location and keep the order they were sent in, so each goes after the one placed before it.
+    def place_row(self, sheet, row, location, placed = None):
+        if placed is not None and row_location(location):
+            index = next(i for i, other in enumerate(sheet['rows']) if other['id'] == placed['id'])
+            sheet['rows'].insert(index + 1, row)
+        elif location.get('toTop'):
+            sheet['rows'].insert(0, row)
+        elif location.get('siblingId'):
+            index = next(i for i, other in enumerate(sheet['rows']) if other['id'] == int(location['siblingId']))
+            sheet['rows'].insert(index + 1, row)
+        else:
+            sheet['rows'].append(row)
+
+    #Stable multi-key sort. Blank cells always go last, text compares without case.
+    def sort_rows(self, sheet, criteria):
+        rows = sheet['rows']
+        for criterion in reversed(criteria):
+            column_id = int(criterion['columnId'])
+            filled = [row for row in rows if cell_value(row, column_id) not in (None, "")]
+            blank = [row for row in rows if cell_value(row, column_id) in (None, "")]
+            filled.sort(key = lambda row: str(cell_value(row, column_id)).casefold(), reverse = criterion['direction'] == "DESCENDING")
+            rows = filled + blank
+        sheet['rows'] = rows
+
+    #Admin endpoints for the benchmark harness.
+    def admin(self, method):
+        url = urlparse(self.path)
+        if url.path == "/_stats":
+            return self.send_json(self.state.stats())
+        if url.path == "/_state":
+            with self.state.lock:
+                return self.send_json(self.state.sheets)
+        if url.path == "/_reset" and method == "POST":
+            with self.state.lock:
+                self.state.config.update(parse_qs(url.query))
+                self.state.reset()
+            return self.send_json({"message": "SUCCESS"})
+        if url.path == "/_reset_stats" and method == "POST":
+            with self.state.lock:
+                self.state.requests, self.state.bytes_sent, self.state.rate_limited = {}, 0, 0
+            return self.send_json({"message": "SUCCESS"})
+        return self.send_json({"message": "Not Found"}, 404)
+
+    def handle_method(self, method):
+        if self.path.startswith("/_"):
+            return self.admin(method)
+        return self.api_call(method)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_PUT(self):
+        self.handle_method("PUT")
+
+    def do_DELETE(self):
+        self.handle_method("DELETE")
+
+#Builds the server without starting it, port 0 picks a free port.
+def make_server(config, host = "127.0.0.1", port = 0):
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(config)})
+    return ThreadingHTTPServer((host, port), handler)
+
+def argument_checker():
+    argParser = argparse.ArgumentParser(description = "Mock Snipe-IT and Smartsheet api for benchmarking")
+    argParser.add_argument("-p", "--port", type = int, default = 8800, help = "Port to listen on, 0 picks a free one (default = 8800)")
+    argParser.add_argument("--assets", type = int, default = 1000, help = "Number of Snipe-IT assets")
+    argParser.add_argument("--activity", type = int, default = 1000, help = "Number of Snipe-IT activity entries")
+    argParser.add_argument("--activity-days", type = int, default = 30, help = "Days the activity entries are spread over")
+    argParser.add_argument("--hr-rows", type = int, default = 1000, help = "Rows on the HR sheet")
+    argParser.add_argument("--it-rows", type = int, default = 800, help = "Rows on the IT sheet")
+    argParser.add_argument("--latency", type = float, default = 0.0, help = "Seconds added to every api call")
+    argParser.add_argument("--rate-limit", type = int, default = 0, help = "Api calls allowed per second, 0 for no limit")
+    argParser.add_argument("--max-page-size", type = int, default = 500, help = "Largest Snipe-IT page size")
+    argParser.add_argument("--seed", type = int, default = 1, help = "Random seed for the datasets")
+    argParser.add_argument("--no-filters", action = "store_true", help = "Ignore Snipe-IT's status and action_type filters")
+    argParser.add_argument("--pairs", type = int, default = 1, help = "HR/IT/archive sheet sets, ids of the extra ones are offset by 10 (sheets) and 1000 (columns) per set")
+    argParser.add_argument("--no-etags", action = "store_true", help = "Leave ETag off Snipe-IT responses and ignore If-None-Match")
+    return argParser.parse_args()
+
+def main():
+    args = argument_checker()
+    config = MockConfig(args.assets, args.activity, args.activity_days, args.hr_rows, args.it_rows,
+                        args.latency, args.rate_limit, args.max_page_size, args.seed, 0 if args.no_filters else 1, 0 if args.no_etags else 1, args.pairs)
+    server = make_server(config, port = args.port)
+    print(f"Mock api listening on http://127.0.0.1:{server.server_address[1]}", flush = True)
+    print(f"  Snipe-IT:   http://127.0.0.1:{server.server_address[1]}/api/v1")
+    print(f"  Smartsheet: http://127.0.0.1:{server.server_address[1]}/2.0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
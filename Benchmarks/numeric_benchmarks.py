@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import argparse
+import math
+import os
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCHMARK_DIR), "Helpers"))
+
+import numericHelpers
+
+#The loops numericHelpers replaced, kept to compare against.
+def legacy_fibonacci(n):
+    counter1, counter2 = 0, 1
+    for i in range(n):
+        counter1 = counter1 + counter2
+        counter2 = counter1 - counter2
+    return counter1
+
+def legacy_factorial(n):
+    if n == 0:
+        return 1
+    return n * legacy_factorial(n - 1)
+
+#Seconds func takes, best of repeat runs with the memos cleared before each one.
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        numericHelpers.fibonacciMemo.clear()
+        numericHelpers.factorialMemo.clear()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+#Each case is a name, the n it covers and a function to time. Returns the rows of the results table.
+def run_cases(n, args):
+    batch_dense = list(range(max(n - 1000, 0), n + 1))
+    batch_spread = list(range(n // 10, n + 1, max(n // 10, 1)))
+    cases = [
+        ("fibonacci", lambda: numericHelpers.fibonacci(n)),
+        ("factorial", lambda: numericHelpers.factorial(n)),
+        ("fibonacciBatch dense", lambda: numericHelpers.fibonacciBatch(batch_dense)),
+        ("fibonacci each dense", lambda: [numericHelpers.fibonacci(i) for i in batch_dense]),
+        ("fibonacciBatch spread", lambda: numericHelpers.fibonacciBatch(batch_spread)),
+        ("fibonacci each spread", lambda: [numericHelpers.fibonacci(i) for i in batch_spread]),
+        ("factorialBatch spread", lambda: numericHelpers.factorialBatch(batch_spread)),
+        ("factorial each spread", lambda: [numericHelpers.factorial(i) for i in batch_spread])
+    ]
+    if n <= args.legacy_max:
+        cases.append(("legacy fibonacci", lambda: legacy_fibonacci(n)))
+    if n < sys.getrecursionlimit() - 50:
+        cases.append(("legacy factorial", lambda: legacy_factorial(n)))
+    rows = []
+    results = {}
+    for name, func in cases:
+        if args.case and not any(part in name for part in args.case):
+            continue
+        seconds, results[name] = best_time(func, args.repeat)
+        rows.append((name, n, seconds))
+    #The fast versions have to agree with the plain ones.
+    checks = [("fibonacci", "legacy fibonacci"), ("factorial", "legacy factorial"), ("fibonacciBatch dense", "fibonacci each dense"),
+              ("fibonacciBatch spread", "fibonacci each spread"), ("factorialBatch spread", "factorial each spread")]
+    for fast, plain in checks:
+        if fast in results and plain in results and results[fast] != results[plain]:
+            raise AssertionError(f"{fast} and {plain} disagree for n = {n}")
+    if "factorial" in results and results["factorial"] != math.factorial(n):
+        raise AssertionError(f"factorial disagrees with math.factorial for n = {n}")
+    return rows
+
+def argument_checker():
+    argParser = argparse.ArgumentParser(description = "Benchmarks the Fibonacci and factorial helpers")
+    argParser.add_argument("-n", "--max-n", type = int, default = 10 ** 6, help = "Largest n, the runs go up by powers of ten from 1000 (default = 1000000)")
+    argParser.add_argument("-k", "--case", action = "append", help = "Only run cases whose name contains this, can be repeated")
+    argParser.add_argument("-r", "--repeat", type = int, default = 1, help = "Runs of each case, the best is reported (default = 1)")
+    argParser.add_argument("--legacy-max", type = int, default = 10 ** 5, help = "Largest n the O(n) legacy Fibonacci loop runs for (default = 100000)")
+    return argParser.parse_args()
+
+def main():
+    args = argument_checker()
+    print(f"{'case':<26}{'n':>10}{'seconds':>12}")
+    n = 1000
+    while n <= args.max_n:
+        for name, size, seconds in run_cases(n, args):
+            print(f"{name:<26}{size:>10}{seconds:>12.4f}", flush = True)
+        n *= 10
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import functools
+import glob
+import importlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(REPO_DIR)
+sys.path.append(os.path.join(REPO_DIR, "ProjectTulips"))
+sys.path.append(os.path.join(REPO_DIR, "ProjectReliquery"))
+
+import mock_server
+
+#Files Reliquery keeps next to the script, backed up before a run and put back after. The patterns cover the files of every sheet pair.
+RELIQUERY_STATE_FILES = ['.color_data*.txt', '.reliquery_cache*.json', 'reliquery.debug', 'reliquery.latest.log', 'reliquery.log']
+
+#Sheet pairs in the config the reliquery-pairs scenarios sync, the mock is reset with as many sheet sets for them.
+BENCHMARK_PAIRS = 4
+
+#Functions timed as stages. Only the outermost call is timed when stages call each other, and the
+#request count of a stage is every api call made while it ran, including Tulips' background page fetches.
+STAGES = {
+    "ProjectTulips": ["count_pages_in_time_period", "CsvSink.write_rows"],
+    "ProjectReliquery": ["pull_sheet_version", "pull_data", "pull_data_streaming", "pull_data_cached", "clean_data_based_on_dates_hr", "clean_data_based_on_dates_it",
+                         "reconcile", "sort_sheet", "update_colors_for_it_rows", "RowBatch.flush"]
+}
+
+#Dataset sizes, small is quick enough for a pre-commit check and large covers the 100k row case.
+SIZES = {
+    "small": {"assets": 1000, "activity": 1000, "hr_rows": 1000, "it_rows": 800},
+    "medium": {"assets": 10000, "activity": 10000, "hr_rows": 10000, "it_rows": 8000},
+    "large": {"assets": 100000, "activity": 100000, "hr_rows": 100000, "it_rows": 80000}
+}
+
+#Each scenario is a tool, its arguments, and whether the mock data is reset before it runs.
+SCENARIOS = [
+    {"name": "tulips-hardware", "tool": "ProjectTulips", "argv": ["-a", "key", "-d", "-o", "{tmp}/hardware.csv"]},
+    {"name": "tulips-checkout", "tool": "ProjectTulips", "argv": ["-a", "key", "-co", "-t", "7", "-o", "{tmp}/checkout.csv"]},
+    {"name": "tulips-checkin", "tool": "ProjectTulips", "argv": ["-a", "key", "-ci", "-t", "7", "-o", "{tmp}/checkin.csv"]},
+    {"name": "tulips-all", "tool": "ProjectTulips", "argv": ["-a", "key", "-ci", "-co", "-d", "-t", "7", "-o", "{tmp}/all.csv"]},
+    {"name": "tulips-hardware-cache-cold", "tool": "ProjectTulips", "argv": ["-a", "key", "-d", "-o", "{tmp}/hardware.csv", "--cache", "{tmp}/hardware.sqlite3"]},
+    {"name": "tulips-hardware-cache-warm", "tool": "ProjectTulips", "argv": ["-a", "key", "-d", "-o", "{tmp}/hardware.csv", "--cache", "{tmp}/hardware.sqlite3"]},
+    {"name": "tulips-hardware-cache-revalidate", "tool": "ProjectTulips", "argv": ["-a", "key", "-d", "-o", "{tmp}/hardware.csv", "--cache", "{tmp}/hardware.sqlite3", "--cache-ttl", "0"]},
+    {"name": "tulips-checkout-cache-cold", "tool": "ProjectTulips", "argv": ["-a", "key", "-co", "-t", "7", "-o", "{tmp}/checkout.csv", "--cache", "{tmp}/activity.sqlite3"]},
+    {"name": "tulips-checkout-cache-warm", "tool": "ProjectTulips", "argv": ["-a", "key", "-co", "-t", "7", "-o", "{tmp}/checkout.csv", "--cache", "{tmp}/activity.sqlite3"]},
+    {"name": "reliquery-full", "tool": "ProjectReliquery", "argv": ["-a", "key"], "reset": True},
+    {"name": "reliquery-rerun", "tool": "ProjectReliquery", "argv": ["-a", "key"]},
+    {"name": "reliquery-plan", "tool": "ProjectReliquery", "argv": ["-a", "key", "-p"], "reset": True},
+    {"name": "reliquery-stream", "tool": "ProjectReliquery", "argv": ["-a", "key", "-s"], "reset": True},
+    {"name": "reliquery-incremental-cold", "tool": "ProjectReliquery", "argv": ["-a", "key", "-i"], "reset": True},
+    {"name": "reliquery-incremental-warm", "tool": "ProjectReliquery", "argv": ["-a", "key", "-i"]},
+    {"name": "reliquery-pairs", "tool": "ProjectReliquery", "argv": ["-a", "key", "-c", "{tmp}/pairs.toml"], "reset": True, "mock": {"pairs": BENCHMARK_PAIRS}},
+    {"name": "reliquery-pairs-serial", "tool": "ProjectReliquery", "argv": ["-a", "key", "-c", "{tmp}/pairs.toml", "--concurrent", "1"], "reset": True, "mock": {"pairs": BENCHMARK_PAIRS}}
+]
+
+#Collects wall time, peak memory and request counts for each stage of a run.
+class StageRecorder(object):
+    """Init Constructor"""
+    def __init__(self, server_url):
+        self.server_url = server_url
+        self.stages = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    #Wraps a function so its outermost calls are recorded under name.
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            depth = getattr(self.local, 'depth', 0)
+            self.local.depth = depth + 1
+            if depth:
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.local.depth = depth
+            requests_before = server_stats(self.server_url)['total_requests']
+            tracemalloc.reset_peak()
+            base_memory = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] - base_memory
+                requests_made = server_stats(self.server_url)['total_requests'] - requests_before
+                self.local.depth = depth
+                with self.lock:
+                    stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_bytes": 0, "requests": 0})
+                    stage["calls"] += 1
+                    stage["seconds"] += elapsed
+                    stage["peak_bytes"] = max(stage["peak_bytes"], peak)
+                    stage["requests"] += requests_made
+        return timed
+
+    #Swaps the stage functions of a module for timed versions, returns a function that puts them back.
+    def instrument(self, module, names):
+        originals = []
+        for name in names:
+            owner_name, _, attribute = name.rpartition('.')
+            owner = getattr(module, owner_name) if owner_name else module
+            original = owner.__dict__[attribute] if owner_name else getattr(module, attribute)
+            originals.append((owner, attribute, original))
+            setattr(owner, attribute, self.wrap(name, original))
+        def restore():
+            for owner, attribute, original in originals:
+                setattr(owner, attribute, original)
+        return restore
+
+#Sends a request to one of the mock server's admin endpoints.
+def admin_call(server_url, path, method = "GET"):
+    request = urllib.request.Request(f"{server_url}{path}", method = method, data = b"" if method == "POST" else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+def server_stats(server_url):
+    return admin_call(server_url, "/_stats")
+
+#Points a tool's module constants at the mock server.
+def point_at_mock(module, server_url):
+    if module.__name__ == "ProjectTulips":
+        module.API_URL = f"{server_url}/api/v1"
+    else:
+        module.SMARTSHEET_URL = f"{server_url}/2.0"
+        module.HR_SHEET_ID = mock_server.HR_SHEET_ID
+        module.IT_SHEET_ID = mock_server.IT_SHEET_ID
+        module.ARCHIVE_SHEET_ID = mock_server.ARCHIVE_SHEET_ID
+        module.HR_COLUMNS = dict(zip(module.HR_COLUMNS, mock_server.HR_COLUMN_IDS))
+        module.IT_COLUMNS = dict(zip(module.IT_COLUMNS, mock_server.IT_COLUMN_IDS))
+
+#Writes a --config file for Reliquery listing the mock's first pairs sheet sets.
+def write_pairs_config(path, pairs):
+    lines = []
+    for pair in range(pairs):
+        ids = mock_server.pair_ids(pair)
+        lines += ["[[pairs]]", f'name = "office{pair + 1}"', f"hr_sheet = {ids['hr_sheet']}", f"it_sheet = {ids['it_sheet']}", f"archive_sheet = {ids['archive_sheet']}"]
+        for key in ("hr_columns", "it_columns"):
+            lines.append(f"{key} = {{ " + ", ".join(f"{field} = {column_id}" for field, column_id in zip(mock_server.COLUMN_FIELDS, ids[key])) + " }")
+        lines.append("")
+    with open(path, 'w') as file:
+        file.write("\n".join(lines))
+
+#Runs one scenario in this process, so tracemalloc sees everything the tool allocates.
+def run_scenario(scenario, server_url, tmp_dir):
+    module = importlib.import_module(scenario["tool"])
+    point_at_mock(module, server_url)
+    recorder = StageRecorder(server_url)
+    restore = recorder.instrument(module, STAGES[scenario["tool"]])
+    argv = [arg.replace("{tmp}", tmp_dir) for arg in scenario["argv"]]
+    old_argv, old_cwd = sys.argv, os.getcwd()
+    sys.argv = [scenario["tool"]] + argv
+    before = server_stats(server_url)
+    tracemalloc.start()
+    start = time.perf_counter()
+    error = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.main()
+    except SystemExit as e:
+        error = f"exited with {e.code}" if e.code else None
+    except Exception as e:
+        error = repr(e)
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        sys.argv = old_argv
+        os.chdir(old_cwd)
+        restore()
+    after = server_stats(server_url)
+    requests_made = {endpoint: count - before['requests'].get(endpoint, 0) for endpoint, count in after['requests'].items()
+                     if count - before['requests'].get(endpoint, 0)}
+    return {
+        "seconds": elapsed,
+        "peak_bytes": peak,
+        "requests": sum(requests_made.values()),
+        "bytes_received": after['bytes_sent'] - before['bytes_sent'],
+        "rate_limited": after['rate_limited'] - before['rate_limited'],
+        "endpoints": requests_made,
+        "stages": recorder.stages,
+        "error": error
+    }
+
+#Moves Reliquery's state files out of the way so benchmark runs start clean and don't touch real data.
+@contextlib.contextmanager
+def reliquery_state_backup():
+    reliquery_dir = os.path.join(REPO_DIR, "ProjectReliquery")
+    backup_dir = tempfile.mkdtemp(prefix = "reliquery_state_")
+    for path in reliquery_state_files():
+        shutil.move(path, os.path.join(backup_dir, os.path.basename(path)))
+    try:
+        yield
+    finally:
+        for path in reliquery_state_files():
+            os.remove(path)
+        for name in os.listdir(backup_dir):
+            shutil.move(os.path.join(backup_dir, name), os.path.join(reliquery_dir, name))
+        shutil.rmtree(backup_dir, ignore_errors = True)
+
+#Reliquery's state files that exist right now.
+def reliquery_state_files():
+    reliquery_dir = os.path.join(REPO_DIR, "ProjectReliquery")
+    return [path for pattern in RELIQUERY_STATE_FILES for path in glob.glob(os.path.join(glob.escape(reliquery_dir), pattern))]
+
+#Starts the mock api in its own process so its memory and threads stay out of the measurements.
+def start_mock_server(args):
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, "mock_server.py"), "--port", "0", "--latency", str(args.latency),
+               "--rate-limit", str(args.rate_limit), "--max-page-size", str(args.max_page_size)]
+    for name, value in SIZES[args.size].items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    server = subprocess.Popen(command, stdout = subprocess.PIPE, text = True)
+    server_url = server.stdout.readline().split()[-1]
+    return server, server_url
+
+def format_bytes(size):
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+def print_results(results):
+    print(f"{'scenario':<30}{'requests':>10}{'seconds':>10}{'peak mem':>12}{'received':>12}")
+    for name, result in results.items():
+        print(f"{name:<30}{result['requests']:>10}{result['seconds']:>10.3f}{format_bytes(result['peak_bytes']):>12}{format_bytes(result['bytes_received']):>12}"
+              + (f"  ERROR: {result['error']}" if result['error'] else ""))
+        for stage, numbers in result['stages'].items():
+            print(f"  {stage:<28}{numbers['requests']:>10}{numbers['seconds']:>10.3f}{format_bytes(numbers['peak_bytes']):>12}")
+
+#Compares against a saved baseline. Request counts must not go up, time and memory get the tolerance.
+def compare_results(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if result['requests'] > old['requests']:
+            regressions.append(f"{name}: requests {old['requests']} -> {result['requests']}")
+        if result['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append(f"{name}: seconds {old['seconds']:.3f} -> {result['seconds']:.3f}")
+        if result['peak_bytes'] > old['peak_bytes'] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {format_bytes(old['peak_bytes'])} -> {format_bytes(result['peak_bytes'])}")
+    return regressions
+
+def argument_checker():
+    argParser = argparse.ArgumentParser(description = "Benchmarks Project Tulips and Project Reliquery against the mock api")
+    argParser.add_argument("-s", "--size", choices = SIZES.keys(), default = "small", help = "Dataset size (default = small)")
+    argParser.add_argument("-k", "--scenario", action = "append", help = "Only run scenarios whose name contains this, can be repeated")
+    argParser.add_argument("-l", "--latency", type = float, default = 0.0, help = "Seconds the mock adds to every api call")
+    argParser.add_argument("-r", "--rate-limit", type = int, default = 0, help = "Api calls per second before the mock answers 429")
+    argParser.add_argument("--max-page-size", type = int, default = 500, help = "Largest Snipe-IT page size the mock honours")
+    argParser.add_argument("--save", type = str, help = "Save the results as json to this file")
+    argParser.add_argument("--compare", type = str, help = "Compare against results saved with --save, exits 1 on a regression")
+    argParser.add_argument("--tolerance", type = float, default = 0.25, help = "Allowed slowdown and memory growth for --compare (default = 0.25)")
+    return argParser.parse_args()
+
+def main():
+    args = argument_checker()
+    server, server_url = start_mock_server(args)
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or any(part in scenario["name"] for part in args.scenario)]
+    results = {}
+    with reliquery_state_backup(), tempfile.TemporaryDirectory() as tmp_dir:
+        write_pairs_config(os.path.join(tmp_dir, "pairs.toml"), BENCHMARK_PAIRS)
+        for scenario in scenarios:
+            if scenario.get("reset"):
+                #Mock settings a scenario changes only last until the next reset.
+                admin_call(server_url, "/_reset?" + urllib.parse.urlencode({"pairs": 1, **scenario.get("mock", {})}), "POST")
+                for path in reliquery_state_files():
+                    os.remove(path)
+            print(f"Running {scenario['name']}...", file = sys.stderr)
+            results[scenario["name"]] = run_scenario(scenario, server_url, tmp_dir)
+    server.terminate()
+    server.wait()
+
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent = 2)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            regressions = compare_results(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,16 @@
-
-def revString(str):
-	netstr = ''
-	for i in range(len(str)-1, -1, -1):
-		netstr += str[i]
-	print(netstr)
+import sys
+from numericHelpers import fibonacci, factorial
+from stringHelpers import reverseString
 
 def maxThreeInts(a, b, c):
 	print(max(a,b,c))
 
 
-def factorial(inp):
-	if inp == 0:
-		return 1
-	else:
-		return inp * factorial(inp-1)
-
-
-
-def fibonacci(inp):
-	counter1 = 0
-	counter2 = 1
-	for i in range(0,inp):
-		counter1 = counter1 + counter2
-		counter2 = counter1 - counter2
-	print(counter1)
-
 def userChoice(inp):
 	if inp == 1:
-		fibonacci(int(input("Please enter how many iterations of the Fibonacci sequence you want to check: ")))
+		print(fibonacci(int(input("Please enter how many iterations of the Fibonacci sequence you want to check: "))))
 	if inp == 2:
-		revString(str(input("Please enter a string to be reversed: ")))
+		print(reverseString(str(input("Please enter a string to be reversed: ")), graphemes = True))
 	if inp == 3:
 		print("Please enter 3 integers seperated by spaces to find the greatest")
 		inp = list(map(int, input().split()))
@@ -48,6 +29,7 @@ def userPrompt():#Choices for user running program
 	
 
 def main(): 
+	sys.set_int_max_str_digits(0) #Big factorials and Fibonacci numbers run past Python's default of 4300 printed digits
 	userPrompt()
 
 
@@ -0,0 +1,121 @@
+import math
+from collections import OrderedDict
+
+MEMO_SIZE = 32 * 1024 * 1024 #Bytes of results kept per memo, they get big quickly (factorial(10**6) is about 2MB).
+
+#Bytes an int, or a tuple of ints, takes up.
+def sizeOf(value):
+	if isinstance(value, tuple):
+		return sum(sizeOf(part) for part in value)
+	return value.bit_length() // 8 + 1
+
+#Least recently used cache holding at most size bytes of ints.
+class BoundedMemo(object):
+	"""Init Constructor"""
+	def __init__(self, size = MEMO_SIZE):
+		self.size = size
+		self.used = 0
+		self.values = OrderedDict()
+
+	def get(self, key):
+		value = self.values.get(key)
+		if value is not None:
+			self.values.move_to_end(key)
+		return value
+
+	def put(self, key, value):
+		if key in self.values:
+			self.used -= sizeOf(self.values.pop(key))
+		self.values[key] = value
+		self.used += sizeOf(value)
+		while self.used > self.size:
+			self.used -= sizeOf(self.values.popitem(last = False)[1])
+
+	def clear(self):
+		self.values.clear()
+		self.used = 0
+
+fibonacciMemo = BoundedMemo()
+factorialMemo = BoundedMemo()
+
+def checkInput(inp):
+	if inp < 0:
+		raise ValueError(f"Expected a non-negative integer, got {inp}")
+
+#Returns (F(n), F(n+1)) by fast doubling, O(log n) multiplications.
+#Walks the bits of n from the top, starting from the longest prefix of them already in the memo,
+#and remembers every prefix on the way down so calls for nearby values share their work.
+def fibonacciPair(inp):
+	checkInput(inp)
+	shift = 0
+	pair = fibonacciMemo.get(inp)
+	while pair is None and inp >> shift:
+		shift += 1
+		pair = fibonacciMemo.get(inp >> shift)
+	a, b = pair if pair is not None else (0, 1)
+	while shift:
+		shift -= 1
+		c = a * (2 * b - a) #F(2k)
+		d = a * a + b * b #F(2k+1)
+		a, b = (d, c + d) if (inp >> shift) & 1 else (c, d)
+		fibonacciMemo.put(inp >> shift, (a, b))
+	return a, b
+
+#Returns the nth Fibonacci number, fibonacci(0) = 0 and fibonacci(1) = 1.
+def fibonacci(inp):
+	return fibonacciPair(inp)[0]
+
+#Fibonacci numbers for many n at once, in the order given.
+#Values are worked out in increasing order. Each one steps on from the last by the gap g between them,
+#F(m+g) = F(m)F(g-1) + F(m+1)F(g), which only multiplies by the small F(g) while the gap is smaller than m.
+def fibonacciBatch(inps):
+	results = {}
+	previous, a, b = None, 0, 1
+	for inp in sorted(set(inps)):
+		gap = inp - previous if previous is not None else inp
+		if previous is not None and gap <= previous:
+			gapA, gapB = fibonacciPair(gap)
+			a, b = a * (gapB - gapA) + b * gapA, a * gapA + b * gapB
+			fibonacciMemo.put(inp, (a, b))
+		else:
+			a, b = fibonacciPair(inp)
+		results[inp] = a
+		previous = inp
+	return [results[inp] for inp in inps]
+
+#Product of the integers from low to high by binary splitting, so the big multiplications are between numbers of similar size.
+def rangeProduct(low, high):
+	if high - low < 8:
+		result = 1
+		for i in range(low, high + 1):
+			result *= i
+		return result
+	middle = (low + high) // 2
+	return rangeProduct(low, middle) * rangeProduct(middle + 1, high)
+
+#Returns n!, without recursing once per integer.
+#math.factorial already splits the product into balanced halves in C, which beats doing it in Python.
+def factorial(inp):
+	checkInput(inp)
+	result = factorialMemo.get(inp)
+	if result is None:
+		result = math.factorial(inp)
+		factorialMemo.put(inp, result)
+	return result
+
+#Factorials for many n at once, in the order given.
+#Values are worked out in increasing order, each one carries on from the last with the product of the range between them.
+def factorialBatch(inps):
+	results = {}
+	previous, result = 0, 1
+	for inp in sorted(set(inps)):
+		checkInput(inp)
+		cached = factorialMemo.get(inp)
+		if cached is not None:
+			result = cached
+		elif inp > previous:
+			result *= rangeProduct(previous + 1, inp)
+			factorialMemo.put(inp, result)
+		results[inp] = result
+		previous = inp
+	return [results[inp] for inp in inps]
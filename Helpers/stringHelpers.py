@@ -0,0 +1,178 @@
+import argparse
+import mmap
+import shutil
+import sys
+import tempfile
+import unicodedata
+
+#regex is optional. It knows the full grapheme cluster rules (\X), without it the simplified rules below are used.
+try:
+	import regex
+except ImportError:
+	regex = None
+
+CHUNK_SIZE = 1024 * 1024 #Bytes of a file reversed at a time.
+UNITS = ["byte", "char", "grapheme"]
+
+#Characters that stay attached to the one before them: combining marks, joiners, variation selectors, skin tones and tags.
+def isExtend(ch):
+	code = ord(ch)
+	return (unicodedata.category(ch) in ("Mn", "Me", "Mc") or code in (0x200C, 0x200D) or 0xFE00 <= code <= 0xFE0F
+		or 0x1F3FB <= code <= 0x1F3FF or 0xE0020 <= code <= 0xE007F or 0xE0100 <= code <= 0xE01EF)
+
+def isRegionalIndicator(ch):
+	return 0x1F1E6 <= ord(ch) <= 0x1F1FF
+
+#Hangul syllable type of a character: L, V, T, LV, LVT or None.
+def hangulType(ch):
+	code = ord(ch)
+	if 0x1100 <= code <= 0x115F or 0xA960 <= code <= 0xA97C:
+		return "L"
+	if 0x1160 <= code <= 0x11A7 or 0xD7B0 <= code <= 0xD7C6:
+		return "V"
+	if 0x11A8 <= code <= 0x11FF or 0xD7CB <= code <= 0xD7FB:
+		return "T"
+	if 0xAC00 <= code <= 0xD7A3:
+		return "LV" if (code - 0xAC00) % 28 == 0 else "LVT"
+	return None
+
+#True if a grapheme cluster boundary falls between prev and ch, following the main rules of Unicode UAX #29.
+#regionalCount is the number of regional indicators in a row ending at prev, flags are pairs of them.
+def isBoundary(prev, ch, regionalCount):
+	if prev == "\r" and ch == "\n":
+		return False
+	if unicodedata.category(prev) == "Cc" or unicodedata.category(ch) == "Cc":
+		return True
+	if isExtend(ch) or prev == "\u200d":
+		return False
+	if isRegionalIndicator(prev) and isRegionalIndicator(ch):
+		return regionalCount % 2 == 0
+	prevType, chType = hangulType(prev), hangulType(ch)
+	if prevType == "L" and chType in ("L", "V", "LV", "LVT"):
+		return False
+	if prevType in ("LV", "V") and chType in ("V", "T"):
+		return False
+	if prevType in ("LVT", "T") and chType == "T":
+		return False
+	return True
+
+#Splits text into grapheme clusters, the characters a reader sees as one (e + combining accent, flags, emoji sequences).
+def splitGraphemes(text):
+	if regex is not None:
+		return regex.findall(r"\X", text)
+	clusters = []
+	start = 0
+	regionalCount = 0
+	for i in range(1, len(text)):
+		prev = text[i - 1]
+		regionalCount = regionalCount + 1 if isRegionalIndicator(prev) else 0
+		if isBoundary(prev, text[i], regionalCount):
+			clusters.append(text[start:i])
+			start = i
+	if text:
+		clusters.append(text[start:])
+	return clusters
+
+#Returns text reversed in linear time. With graphemes the clusters keep their characters in order,
+#so accents stay on their letters and flags and emoji sequences survive.
+def reverseString(text, graphemes = False):
+	if not graphemes:
+		return text[::-1]
+	return "".join(reversed(splitGraphemes(text)))
+
+#Moves a chunk start forward to the next UTF-8 character start, past at most 3 continuation bytes.
+def charStart(data, start, end):
+	for i in range(3):
+		if start >= end or data[start] & 0xC0 != 0x80:
+			break
+		start += 1
+	return start
+
+#Works out where the chunk ending at end starts and returns (start, reversed bytes of the chunk).
+#Chunks only start on a character (and for graphemes a cluster) boundary. The part before it is left to the next chunk,
+#and a chunk is widened if one cluster is bigger than it.
+def reverseChunk(data, end, chunkSize, unit):
+	size = chunkSize
+	while True:
+		start = max(0, end - size)
+		if unit == "byte":
+			return start, data[start:end][::-1]
+		if start:
+			start = charStart(data, start, end)
+		chunk = data[start:end]
+		if unit == "char" and start < end and chunk.isascii():
+			return start, chunk[::-1]
+		text = chunk.decode("utf-8", "surrogateescape")
+		if unit == "char":
+			if start < end:
+				return start, text[::-1].encode("utf-8", "surrogateescape")
+		else:
+			clusters = splitGraphemes(text)
+			if not start:
+				return start, "".join(reversed(clusters)).encode("utf-8", "surrogateescape")
+			#The first cluster may carry on from before the chunk, so it goes with the next one. So do the flags after it,
+			#since how regional indicators pair up depends on how many came before them.
+			drop = 1
+			while drop < len(clusters) and isRegionalIndicator(clusters[drop][0]):
+				drop += 1
+			if drop < len(clusters):
+				start += len("".join(clusters[:drop]).encode("utf-8", "surrogateescape"))
+				return start, "".join(reversed(clusters[drop:])).encode("utf-8", "surrogateescape")
+		size *= 2
+
+#Writes the contents of a seekable binary file reversed into target, one chunk at a time from the end,
+#so memory stays at a couple of chunks whatever the size of the file. unit is byte, char (UTF-8) or grapheme.
+#Pages of the mapping that have been written out are handed back to the system as it goes.
+def reverseMapped(source, target, chunkSize = CHUNK_SIZE, unit = "char"):
+	source.seek(0, 2)
+	if not source.tell():
+		return
+	with mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ) as data:
+		end = released = len(data)
+		while end:
+			end, chunk = reverseChunk(data, end, chunkSize, unit)
+			target.write(chunk)
+			page = -(-end // mmap.PAGESIZE) * mmap.PAGESIZE
+			if hasattr(mmap, "MADV_DONTNEED") and page < released:
+				data.madvise(mmap.MADV_DONTNEED, page, released - page)
+				released = page
+
+#Reverses a binary stream into target. Streams that can't be mapped (pipes, sockets) are spooled to a temporary file first.
+def reverseStream(source, target, chunkSize = CHUNK_SIZE, unit = "char"):
+	try:
+		source.fileno()
+		mappable = source.seekable()
+	except (AttributeError, OSError, ValueError):
+		mappable = False
+	if mappable:
+		return reverseMapped(source, target, chunkSize, unit)
+	with tempfile.TemporaryFile() as spool:
+		shutil.copyfileobj(source, spool, chunkSize)
+		spool.flush()
+		reverseMapped(spool, target, chunkSize, unit)
+
+#Reverses the file at inputPath into outputPath, - reads stdin or writes stdout.
+def reverseFile(inputPath, outputPath, chunkSize = CHUNK_SIZE, unit = "char"):
+	source = sys.stdin.buffer if inputPath == "-" else open(inputPath, "rb")
+	target = sys.stdout.buffer if outputPath == "-" else open(outputPath, "wb")
+	try:
+		reverseStream(source, target, chunkSize, unit)
+	finally:
+		if source is not sys.stdin.buffer:
+			source.close()
+		if target is sys.stdout.buffer:
+			target.flush()
+		else:
+			target.close()
+
+def main():
+	argParser = argparse.ArgumentParser(description = "Reverses a file in chunks")
+	argParser.add_argument("input", help = "File to reverse, - reads stdin")
+	argParser.add_argument("output", help = "File to write, - writes stdout")
+	argParser.add_argument("-u", "--unit", choices = UNITS, default = "char", help = "What to reverse: bytes, UTF-8 characters or grapheme clusters (default = char)")
+	argParser.add_argument("-c", "--chunk-size", type = int, default = CHUNK_SIZE, help = "Bytes reversed at a time (default = 1048576)")
+	args = argParser.parse_args()
+	reverseFile(args.input, args.output, max(args.chunk_size, 4), args.unit)
+
+if __name__ == '__main__':
+	main()
@@ -2,7 +2,7 @@
 
 import requests
 import argparse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone, date, time as day_start
 import time
 import json
 import sys
@@ -10,14 +10,76 @@ import inspect
 import logging
 import traceback
 import os
-
+import re
+import io
+import tomllib
+import functools
+import bisect
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#The shared client lives one folder up so both projects use the same pooled session.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from Shared import http_client, instrumentation, async_client, json_stream
+from Shared.atomic_file import write_file_atomically
+
+#PyYAML is optional, it is only needed for a --config file written in YAML instead of TOML.
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+#Bulk request limits. Smartsheet handles a few hundred rows per body comfortably,
+#and deletes pass their ids in the url so they are kept under the url length limit.
+DEFAULT_CHUNK_SIZE = 500
+MAX_DELETE_IDS = 400
+
+#Requests per second allowed across every thread of a run. Smartsheet allows 300 requests a minute per token.
+DEFAULT_RATE_LIMIT = 5
+
+#Bytes read from the connection at a time when a sheet is streamed.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+#Sort order of the IT sheet: hire date newest first, then title, then first name.
+SORT_CRITERIA = [("hire_date", "DESCENDING"), ("title", "DESCENDING"), ("first_name", "ASCENDING")]
+#Most row move requests sent to put the sheet in order before the full sort is used instead.
+SORT_MOVE_LIMIT = 10
+
+#Sheet pairs synced at the same time with --config. They share one session, so the rate limit covers all of them.
+DEFAULT_CONCURRENT_PAIRS = 4
+
+#Incremental sync cache. Rows modified shortly before the last sync are fetched again to cover clock skew.
+CACHE_FILE = '.reliquery_cache.json'
+CACHE_OVERLAP = timedelta(minutes = 10)
+
+#Smartsheet api and the sheets being synced.
+SMARTSHEET_URL = "https://api.smartsheet.com/2.0"
+HR_SHEET_ID = "*hr_sheet_id*"
+IT_SHEET_ID = "*it_sheet_id*"
+ARCHIVE_SHEET_ID = "*archive_sheet_id*"
+
+#Column ids for each sheet, keyed by the IT_Row field they fill.
+#The sheet and column ids here make up the one pair synced without --config.
+HR_COLUMNS = {
+    "hire_date": "*exampleColumnId*",
+    "first_name": "*exampleColumnId*",
+    "last_name": "*exampleColumnId*",
+    "title": "*exampleColumnId*",
+    "office": "*exampleColumnId*",
+    "pmail": "*exampleColumnId*"
+}
+IT_COLUMNS = {
+    "hire_date": "*exampleColumnId*",
+    "first_name": "*exampleColumnId*",
+    "last_name": "*exampleColumnId*",
+    "title": "*exampleColumnId*",
+    "office": "*exampleColumnId*",
+    "pmail": "*exampleColumnId*"
+}
 
 #Class that has IT row properties.
+#Rows are slotted, a sync holds one per person on both sheets.
 class IT_Row(object):
-    color_list = [5,8,9]
-    color_file_path = '.color_data.txt'
-    color_map = {}
-    color_index = 1
+    __slots__ = ("_hire_date", "hire_ordinal", "first_name", "last_name", "title", "office", "pmail", "row_id")
 
     """Init Constructor"""
     def __init__(self, hire_date=None, first_name=None, last_name=None, title=None, office=None, pmail=None, row_id=None):
@@ -30,53 +92,405 @@ class IT_Row(object):
         self.pmail = pmail
         self.row_id = row_id
 
-    #This formats the object for post request to update fields.
-    def to_json(self):
-        color = self.colorizer(self.hire_date)
+    #The hire date as the sheet has it ('YYYY-MM-DD'). Setting it also sets hire_ordinal, the same date as a day number.
+    @property
+    def hire_date(self):
+        return self._hire_date
+
+    @hire_date.setter
+    def hire_date(self, value):
+        self._hire_date = value
+        self.hire_ordinal = date_ordinal(value) if value else None
+
+    #Builds a row from a SheetRow view, reading each field once.
+    @classmethod
+    def from_sheet_row(cls, row, row_id=None):
+        return cls(row.value("hire_date"), row.value("first_name"), row.value("last_name"), row.value("title"), row.value("office"), row.value("pmail"), row_id)
+
+    #This formats the object for post request to update fields, color comes from ColorState.assign.
+    #columns are the IT sheet's column ids, keyed like IT_COLUMNS.
+    def to_json(self, color, columns):
         return [{       
             "format": f",,,,,,2,,,{color},,,,,,", #Format string.
+            "toBottom": True, #New rows go below the rest, the run's snapshot expects them there.
             "cells": [
-            {"columnId": "*exampleColumnId*", "value": self.hire_date}, #IT Sheet ColumnIds.
-            { "columnId": "*exampleColumnId*", "value": self.first_name},
-            { "columnId": "*exampleColumnId*", "value": self.last_name},
-            { "columnId": "*exampleColumnId*", "value": self.title},
-            { "columnId": "*exampleColumnId*", "value": self.office},
-            { "columnId": "*exampleColumnId*", "value": self.pmail}
+            {"columnId": columns["hire_date"], "value": self.hire_date}, #IT Sheet ColumnIds.
+            { "columnId": columns["first_name"], "value": self.first_name},
+            { "columnId": columns["last_name"], "value": self.last_name},
+            { "columnId": columns["title"], "value": self.title},
+            { "columnId": columns["office"], "value": self.office},
+            { "columnId": columns["pmail"], "value": self.pmail}
             ]
         }]
 
-    #This determines colors on row creation by reading the hidden .color_data.txt file.
-    def load_color_data(cls):
+#One HR sheet synced into one IT sheet, with the archive sheet old IT rows are moved to.
+#Every pair keeps its own color and cache files, so pairs never share state between runs.
+class SheetPair(object):
+    """Init Constructor"""
+    def __init__(self, name, hr_sheet_id, it_sheet_id, archive_sheet_id, hr_columns, it_columns, color_file = '.color_data.txt', cache_file = CACHE_FILE):
+        self.name = name
+        self.hr_sheet_id = hr_sheet_id
+        self.it_sheet_id = it_sheet_id
+        self.archive_sheet_id = archive_sheet_id
+        self.hr_columns = hr_columns
+        self.it_columns = it_columns
+        self.color_file = color_file
+        self.cache_file = cache_file
+
+    #The pair set up by the constants at the top of the file.
+    @classmethod
+    def from_constants(cls):
+        return cls("default", HR_SHEET_ID, IT_SHEET_ID, ARCHIVE_SHEET_ID, HR_COLUMNS, IT_COLUMNS)
+
+    @property
+    def hr_url(self):
+        return f"{SMARTSHEET_URL}/sheets/{self.hr_sheet_id}"
+
+    @property
+    def it_url(self):
+        return f"{SMARTSHEET_URL}/sheets/{self.it_sheet_id}"
+
+#Reads the sheet pairs from a --config file, TOML unless it ends in .yaml or .yml.
+#Keys at the top level are defaults for every pair, so pairs sharing an archive sheet or a column layout only list what differs.
+#Raises ValueError when the file can't be parsed or a pair is incomplete.
+def load_pairs(path):
+    with open(path, 'rb') as file:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ValueError(f"Reading {path} needs the PyYAML package, or write the config as TOML")
+            try:
+                config = yaml.safe_load(file) or {}
+            except yaml.YAMLError as e:
+                raise ValueError(f"Could not parse {path}: {e}")
+        else:
+            try:
+                config = tomllib.load(file)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"Could not parse {path}: {e}")
+    if not isinstance(config, dict) or not all(isinstance(entry, dict) for entry in config.get('pairs') or []):
+        raise ValueError(f"{path} has to be a table of defaults with a list of pair tables under 'pairs'")
+    defaults = {key: value for key, value in config.items() if key != 'pairs'}
+    pairs = []
+    for number, entry in enumerate(config.get('pairs') or [], 1):
+        entry = {**defaults, **entry}
+        name = str(entry.get('name', number))
+        #The name goes into the pair's file names.
+        if not re.fullmatch(r'[\w.-]+', name) or name in (pair.name for pair in pairs):
+            raise ValueError(f"Pair name {name!r} in {path} has to be unique and only use letters, digits, '.', '_' and '-'")
+        missing = [key for key in ("hr_sheet", "it_sheet", "archive_sheet", "hr_columns", "it_columns") if key not in entry]
+        missing += [f"{key}.{field}" for key in ("hr_columns", "it_columns") if key in entry for field in IT_COLUMNS if field not in entry[key]]
+        if missing:
+            raise ValueError(f"Pair {name} in {path} is missing {', '.join(missing)}")
+        pairs.append(SheetPair(name, entry['hr_sheet'], entry['it_sheet'], entry['archive_sheet'], entry['hr_columns'], entry['it_columns'],
+                               f'.color_data.{name}.txt', f'.reliquery_cache.{name}.json'))
+    if not pairs:
+        raise ValueError(f"{path} doesn't list any pairs")
+    return pairs
+
+#Keeps track of the colors given to new rows, persisted in the hidden .color_data.txt file.
+#The file is read once per run, colors are handed out in memory and the file is written once at the end.
+class ColorState(object):
+    color_list = [5,8,9]
+
+    """Init Constructor"""
+    def __init__(self, path = '.color_data.txt', color_id = 0, last_hire_date = '', future_hire_date = ''):
+        self.path = path
+        self.color_id = color_id
+        self.last_hire_date = last_hire_date
+        self.future_hire_date = future_hire_date
+        self.changed = False
+        #State after each color handed out this run, starting with the loaded one, so colors of rows that never got created can be taken back.
+        self.history = [(color_id, last_hire_date, future_hire_date)]
+
+    #Reads the saved state, starting fresh if the file is missing or unreadable.
+    @classmethod
+    def load(cls, path = '.color_data.txt'):
         try:
-            with open(cls.color_file_path, 'r') as file:
+            with open(path, 'r') as file:
                 data = file.read().strip().split(',')
-                color_id = int(data[0])
-                last_hire_date = data[1]
-                future_hire_date = data[2]
-                return color_id, last_hire_date, future_hire_date
+                return cls(path, int(data[0]), data[1], data[2])
         except (FileNotFoundError, ValueError, IndexError):
-            return 0, '', ''
-
-    #Writes color data to file for persistence. 
-    def save_color_data(cls, color_id, last_hire_date, future_hire_date):
-        with open(cls.color_file_path, 'w') as file:
-            file.write(f"{color_id},{last_hire_date},{future_hire_date}")
-
-    #Sets the color for the row being created.
-    def colorizer(cls, hire_date):
-        current_color_id, last_hire_date, future_hire_date = cls.load_color_data()
+            return cls(path)
 
+    #Sets the color for a row being created. Rows sharing a hire date share a color.
+    def assign(self, hire_date):
         # Check if the hire_date is greater than the last processed hire_date
-        if hire_date != last_hire_date:
-            last_hire_date = hire_date
-            current_color_id = (current_color_id + 1) % len(cls.color_list)
-
-        if hire_date > future_hire_date:
-            future_hire_date = hire_date
+        if hire_date != self.last_hire_date:
+            self.last_hire_date = hire_date
+            self.color_id = (self.color_id + 1) % len(self.color_list)
+
+        if hire_date > self.future_hire_date:
+            self.future_hire_date = hire_date
+
+        self.changed = True
+        self.history.append((self.color_id, self.last_hire_date, self.future_hire_date))
+        return self.color_list[self.color_id]
+
+    #Colors for a whole batch of new rows, in order.
+    def assign_all(self, rows):
+        return [self.assign(row.hire_date) for row in rows]
+
+    #Keeps the colors of the first count rows handed out and takes back the rest, whose rows never made it onto the sheet.
+    def keep(self, count):
+        if count >= len(self.history) - 1:
+            return
+        self.color_id, self.last_hire_date, self.future_hire_date = self.history[count]
+        self.history = self.history[:count + 1]
+        self.changed = count > 0
+
+    #Writes the state once, atomically, at the end of the run.
+    def save(self):
+        if not self.changed:
+            return
+        write_file_atomically(self.path, f"{self.color_id},{self.last_hire_date},{self.future_hire_date}")
+        self.changed = False
+
+#Local copy of the sheets kept between runs in the hidden .reliquery_cache.json file.
+#Scheduled runs only download rows changed since the last sync, and skip entirely when nothing changed.
+class SheetCache(object):
+    """Init Constructor"""
+    def __init__(self, path = CACHE_FILE, sheets = None, last_run = None):
+        self.path = path
+        self.sheets = sheets or {} #url -> {"version", "synced_at", "data"}
+        self.last_run = last_run or {}
+
+    #Reads the cache, starting empty if the file is missing or unreadable.
+    @classmethod
+    def load(cls, path = CACHE_FILE):
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+                return cls(path, data.get('sheets'), data.get('last_run'))
+        except (FileNotFoundError, ValueError, AttributeError):
+            return cls(path)
+
+    def save(self):
+        write_file_atomically(self.path, json.dumps({"sheets": self.sheets, "last_run": self.last_run}))
+
+    #A run would do nothing new if the sheets are on the versions the last run left them at, on the same day.
+    #The day matters because rows move between future, current and old as dates pass.
+    def unchanged_since_last_run(self, versions):
+        return self.last_run.get('date') == date.today().isoformat() and self.last_run.get('versions') == versions
+
+    def record_run(self, versions):
+        self.last_run = {"date": date.today().isoformat(), "versions": versions}
+
+    def forget_run(self):
+        self.last_run = {}
+
+    #Drops a cached sheet so the next run downloads it in full.
+    def invalidate(self, api_url):
+        self.sheets.pop(api_url, None)
+
+#The IT sheet as this run expects it to be. It is fetched once with formats, and every change the run
+#makes is applied to it locally, so later stages read it instead of downloading the sheet again.
+#It works on the response dict in place, which keeps a cached copy of the sheet in step as well.
+class SheetSnapshot(object):
+    """Init Constructor"""
+    def __init__(self, data, columns):
+        self.data = data
+        self.columns = columns #The IT sheet's column ids, keyed like IT_COLUMNS.
+        self.rows_by_id = {row['id']: row for row in data['rows']}
+        self.stale = False #Set when a change may not have gone through and the sheet has to be fetched again.
+
+    #Checks a mutation response. Anything short of full success leaves the sheet unpredictable.
+    def confirm(self, result):
+        if not result or result.get('failedItems'):
+            self.stale = True
+            return False
+        return True
+
+    def remove_rows(self, row_ids):
+        row_ids = set(row_ids)
+        self.data['rows'] = [row for row in self.data['rows'] if row['id'] not in row_ids]
+        for row_id in row_ids:
+            self.rows_by_id.pop(row_id, None)
+
+    #Applies bulk update payloads ({"id", "cells"}) to the matching rows.
+    def update_rows(self, updates):
+        for update in updates:
+            row = self.rows_by_id.get(update['id'])
+            if row is None:
+                self.stale = True
+                continue
+            for change in update['cells']:
+                column_id = int(change['columnId'])
+                cell = next((cell for cell in row['cells'] if cell['columnId'] == column_id), None)
+                if cell is None:
+                    cell = {"columnId": column_id}
+                    row['cells'].append(cell)
+                if change.get('value') in (None, ""):
+                    cell.pop('value', None)
+                else:
+                    cell['value'] = change['value']
+                if 'format' in change:
+                    cell['format'] = change['format']
+
+    #Puts the rows in the order the server's sort produces.
+    def sort(self, criteria):
+        self.data['rows'] = self.sorted_rows(criteria)
+
+    #The rows in the order the server's sort would put them in. Blank cells always go last and ties keep their current order.
+    def sorted_rows(self, criteria):
+        rows = self.data['rows']
+        for name, direction in reversed(criteria):
+            column_id = int(self.columns[name])
+            values = {row['id']: next((cell.get('value') for cell in row['cells'] if cell['columnId'] == column_id), None) for row in rows}
+            filled = [row for row in rows if values[row['id']] not in (None, "")]
+            blank = [row for row in rows if values[row['id']] in (None, "")]
+            filled.sort(key = lambda row: str(values[row['id']]).casefold(), reverse = direction == "DESCENDING")
+            rows = filled + blank
+        return rows
+
+    #Adds created rows using the ids from the response. The row format sent with each row applies to all of its cells.
+    def add_rows(self, sent_rows, result):
+        for sent, created in zip(sent_rows, result.get('result') or []):
+            cells = created.get('cells') or sent['cells']
+            row = {"id": created['id'], "cells": [dict(cell, columnId = int(cell['columnId'])) for cell in cells]}
+            for cell in row['cells']:
+                cell.setdefault('format', sent.get('format'))
+            self.data['rows'].append(row)
+            self.rows_by_id[row['id']] = row
+
+#Position of every column in a sheet's rows, built once per sheet response.
+class ColumnIndex(object):
+    __slots__ = ("positions",)
 
-        cls.save_color_data(current_color_id, last_hire_date, future_hire_date)
+    """Init Constructor"""
+    def __init__(self, column_ids):
+        self.positions = {int(column_id): position for position, column_id in enumerate(column_ids)}
+
+    #Reads the column order from the sheet, or from the first row when the response has no columns.
+    @classmethod
+    def from_sheet(cls, data):
+        if data.get('columns'):
+            return cls(column['id'] for column in data['columns'])
+        if data.get('rows'):
+            return cls(cell['columnId'] for cell in data['rows'][0]['cells'])
+        return cls([])
+
+    #Turns {field: column id} into {field: (position, column id)}, parsing each column id once.
+    def fields(self, columns):
+        return {name: (self.positions.get(int(column_id)), int(column_id)) for name, column_id in columns.items()}
+
+#Read only view over one row's cells. Fields are read by position, so each lookup is constant time.
+class SheetRow(object):
+    __slots__ = ("id", "cells", "fields")
 
-        return cls.color_list[current_color_id]
+    """Init Constructor"""
+    def __init__(self, row, fields):
+        self.id = row.get('id')
+        self.cells = row['cells']
+        self.fields = fields
+
+    #Finds the cell for a field, scanning the row only if its cells are not in column order.
+    def cell(self, name):
+        position, column_id = self.fields[name]
+        if position is not None and position < len(self.cells) and self.cells[position]['columnId'] == column_id:
+            return self.cells[position]
+        return next((cell for cell in self.cells if cell['columnId'] == column_id), None)
+
+    def value(self, name):
+        cell = self.cell(name)
+        return cell.get('value') if cell else None
+
+    def format(self, name):
+        cell = self.cell(name)
+        return cell.get('format') if cell else None
+
+#Wraps every row of a sheet response in a SheetRow sharing one column index.
+def sheet_rows(data, columns):
+    fields = ColumnIndex.from_sheet(data).fields(columns)
+    for row in data['rows']:
+        yield SheetRow(row, fields)
+
+#Collects row mutations during a sync and sends them in bulk.
+#Moves, updates, deletes and creates each go out in chunks instead of one request per row.
+#Smartsheet rejects a write to a sheet while another write to it is still running (error 4004),
+#so the chunks are sent one at a time. Syncs of different pairs still run side by side.
+class RowBatch(object):
+    """Init Constructor"""
+    def __init__(self, archive_sheet_id, chunk_size = DEFAULT_CHUNK_SIZE, use_async = False):
+        self.archive_sheet_id = archive_sheet_id
+        self.chunk_size = max(1, chunk_size)
+        self.use_async = use_async
+        self.delete_chunk_size = min(self.chunk_size, MAX_DELETE_IDS)
+        self.moves = []
+        self.updates = []
+        self.deletes = []
+        self.creates = []
+        self.created = 0 #Queued new rows in the create chunks that went through before the first one that failed, set by flush.
+
+    #Queues a row to be moved to the archive sheet.
+    def move(self, row_id):
+        self.moves.append(row_id)
+
+    #Queues cell changes for an existing row.
+    def update(self, row_id, payload):
+        self.updates.append({"id": row_id, **payload})
+
+    #Queues a row to be deleted.
+    def delete(self, row_id):
+        self.deletes.append(row_id)
+
+    #Queues new rows, takes the list returned by IT_Row.to_json().
+    def create(self, rows):
+        self.creates.extend(rows)
+
+    #Sends everything queued so far and empties the batch, keeping the snapshot (if any) in step.
+    #Chunks go out on the shared session or one asyncio client, results are applied to the snapshot in the order sent.
+    def flush(self, api_url, headers, snapshot = None):
+        if self.use_async:
+            client = async_client.build_client(concurrency = 1, timeout = http_client.get_session().timeout)
+            removed, updated, created = async_client.run(self.send_async(client, api_url, headers), client)
+        else:
+            removed, updated, created = self.send(api_url, headers)
+        self.created = 0
+        for chunk, result in created:
+            if not result or result.get('failedItems'):
+                break
+            self.created += len(chunk)
+        if snapshot:
+            for chunk, result in removed:
+                if snapshot.confirm(result):
+                    snapshot.remove_rows(chunk)
+            for chunk, result in updated:
+                if snapshot.confirm(result):
+                    snapshot.update_rows(chunk)
+            for chunk, result in created:
+                if snapshot.confirm(result):
+                    snapshot.add_rows(chunk, result)
+        self.moves, self.updates, self.deletes, self.creates = [], [], [], []
+
+    #Sends the chunks one after another. Returns (chunk, result) pairs for removed, updated and created rows.
+    #Rows leaving the sheet go first so updates never touch a row that is about to be moved.
+    #Moved rows land on the archive sheet and new rows at the bottom of this one in the order they are sent.
+    def send(self, api_url, headers):
+        archive = functools.partial(archive_row, archive_sheet_id = self.archive_sheet_id)
+        delete = lambda api_url, headers, chunk: delete_row(api_url, headers, ",".join(str(row_id) for row_id in chunk))
+        removed = (send_in_order(archive, api_url, headers, chunked(self.moves, self.chunk_size))
+                   + send_in_order(delete, api_url, headers, chunked(self.deletes, self.delete_chunk_size)))
+        updated = send_in_order(update_row, api_url, headers, chunked(self.updates, self.chunk_size))
+        return removed, updated, send_in_order(create_row, api_url, headers, chunked(self.creates, self.chunk_size))
+
+    #Async version of send with the same order.
+    async def send_async(self, client, api_url, headers):
+        async def in_order(send, chunks):
+            return [(chunk, await send(client, api_url, headers, chunk)) for chunk in chunks]
+
+        archive = functools.partial(archive_row_async, archive_sheet_id = self.archive_sheet_id)
+        removed = await in_order(archive, chunked(self.moves, self.chunk_size)) + await in_order(delete_row_async, chunked(self.deletes, self.delete_chunk_size))
+        updated = await in_order(update_row_async, chunked(self.updates, self.chunk_size))
+        return removed, updated, await in_order(create_row_async, chunked(self.creates, self.chunk_size))
+
+#Sends chunks one after another with send(api_url, headers, chunk), returns each chunk with its result.
+def send_in_order(send, api_url, headers, chunks):
+    return [(chunk, send(api_url, headers, chunk)) for chunk in chunks]
+
+#Splits a list into pieces of at most size items.
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 #Checks input arguments
 def argument_checker():
@@ -85,14 +499,53 @@ def argument_checker():
     argParser.add_argument("-f", "--keyfile", type = str, required = False, help = "File storing API key")
     argParser.add_argument("-d", "--debug", action="store_true", required = False, help = "Enables debug logging")
     argParser.add_argument("-v", "--verbose", action="store_true", required = False, help = "Enables verbose printing")
+    argParser.add_argument("-i", "--incremental", action="store_true", required = False, help = "Only downloads rows changed since the last run")
+    argParser.add_argument("-p", "--plan", action="store_true", required = False, help = "Prints the sync plan without changing the sheets")
+    argParser.add_argument("-s", "--stream", action="store_true", required = False, help = "Parses sheets as they download, keeping only the rows that are needed")
+    argParser.add_argument("-b", "--batchsize", type = int, default = DEFAULT_CHUNK_SIZE, required = False, help = "Rows sent per bulk request")
+    #Writes to a sheet go one at a time now, -w is still accepted so existing scripts keep working.
+    argParser.add_argument("-w", "--workers", type = int, required = False, help = argparse.SUPPRESS)
+    argParser.add_argument("--rate-limit", type = float, default = DEFAULT_RATE_LIMIT, required = False, help = "Most requests per second sent to the api")
+    argParser.add_argument("--async", dest = "use_async", action="store_true", required = False, help = "Sends bulk requests on one asyncio client")
+    argParser.add_argument("--timeout", type = float, default = http_client.DEFAULT_TIMEOUT, required = False, help = "Seconds to wait on the api before giving up")
+    argParser.add_argument("-c", "--config", type = str, required = False, help = "TOML or YAML file listing the HR/IT sheet pairs to sync, instead of the ids in the script")
+    argParser.add_argument("--concurrent", type = int, default = DEFAULT_CONCURRENT_PAIRS, required = False, help = "Sheet pairs from --config synced at the same time")
+    argParser.add_argument("-m", "--metrics", type = str, required = False, help = "Writes run metrics to this file, Prometheus textfile if it ends in .prom, json otherwise")
 
     args = argParser.parse_args()
     return args
 
+#Everything a run needs to know about how it was started: the parsed options, the logger and the verbosity.
+#Built once at startup so nothing reparses the command line per request.
+class RunContext(object):
+    """Init Constructor"""
+    def __init__(self, args):
+        self.args = args
+        self.verbose = args.verbose
+        self.logger = logging.getLogger("reliquery")
+
+    #Checked before building any debug message, so production runs skip the formatting.
+    @property
+    def debug(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+_context = None
+
+#Parses the command line and makes it the context of this run.
+def init_context(args = None):
+    global _context
+    _context = RunContext(args if args is not None else argument_checker())
+    return _context
+
+#Returns the run context, building it from the command line if no run set one up.
+def get_context():
+    if _context is None:
+        return init_context()
+    return _context
+
 #Checks four conditions of API key possibilities. Could potentially upgrade this to use keyring?
-def check_api_key():
+def check_api_key(args):
     #Checks for -a arg.
-    args = argument_checker()
     if args.apikey:
         return args.apikey
 
@@ -117,8 +570,7 @@ def check_api_key():
     return input("Enter API key: ")
 
 #Sets up logging for the script.
-def configure_logging():
-    args = argument_checker()
+def configure_logging(args):
     if args.debug:
         # Debug mode configuration: Show all requests' info
         logging.basicConfig(filename = 'reliquery.debug', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', filemode = 'w')
@@ -128,9 +580,10 @@ def configure_logging():
         logging.basicConfig(filename = 'reliquery.log', level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s', filemode = 'a')
 
 #Sends a http GET request to the sheet.
+@instrumentation.timed("pull_data")
 def pull_data(api_url, headers):
     try:
-        response = requests.get(api_url, headers=headers)
+        response = http_client.get_session().get(api_url, headers=headers)
         log_debug_info(response, name = "pull_data function")
         response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
         return response.json()
@@ -138,11 +591,66 @@ def pull_data(api_url, headers):
         logging.error(f"Error occurred: {e}")
         return None
 
+#Sends a http GET request to the sheet and parses the rows as they arrive instead of loading the whole response.
+#consume gets a json_stream.SheetStream and must read it before the connection closes, its result is returned.
+#Returns None if the request fails or the download breaks off part way.
+@instrumentation.timed("pull_data")
+def pull_data_streaming(api_url, headers, consume):
+    try:
+        with http_client.get_session().get(api_url, headers = headers, stream = True) as response:
+            log_debug_info(response, name = "pull_data_streaming function")
+            response.raise_for_status()
+            return consume(json_stream.SheetStream(response.iter_content(STREAM_CHUNK_SIZE)))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Error occurred: {e}")
+        return None
+
+#Sends a http GET request for the sheet's version number, which goes up on every change.
+def pull_sheet_version(api_url, headers):
+    data = pull_data(f"{api_url}/version", headers)
+    return data.get('version') if data else None
+
+#Pulls a sheet through the cache. The cached copy is used as is when the version hasn't moved,
+#otherwise only rows modified since the last sync are downloaded and merged in.
+def pull_data_cached(api_url, headers, cache, version = None):
+    if version is None:
+        version = pull_sheet_version(api_url.split('?')[0], headers)
+    entry = cache.sheets.get(api_url)
+    if entry and version is not None and entry['version'] == version:
+        return entry['data']
+
+    synced_at = (datetime.now(timezone.utc) - CACHE_OVERLAP).strftime('%Y-%m-%dT%H:%M:%SZ')
+    data = None
+    if entry:
+        separator = '&' if '?' in api_url else '?'
+        changed = pull_data(f"{api_url}{separator}rowsModifiedSince={entry['synced_at']}", headers)
+        if changed:
+            data = merge_changed_rows(entry['data'], changed)
+    if data is None:
+        data = pull_data(api_url, headers)
+    if data:
+        cache.sheets[api_url] = {"version": version, "synced_at": synced_at, "data": data}
+    return data
+
+#Merges the rows modified since the last sync into the cached sheet, keeping the sheet's row order.
+#Returns None if rows were deleted on the server, since a list of modified rows can't show those.
+def merge_changed_rows(cached, changed):
+    changed_ids = {row['id'] for row in changed['rows']}
+    rows = [row for row in cached['rows'] if row['id'] not in changed_ids]
+    if len(rows) + len(changed_ids) != changed.get('totalRowCount'):
+        return None
+    for row in sorted(changed['rows'], key = lambda row: row.get('rowNumber', 0)):
+        rows.insert(row['rowNumber'] - 1 if row.get('rowNumber') else len(rows), row)
+    merged = dict(changed)
+    merged['rows'] = rows
+    return merged
+
 #Sends a http GET request for a specific row of the sheet.
+@instrumentation.timed("pull_row_data")
 def pull_row_data(api_url, headers, row_id):
     api_url = f"{api_url}/rows/{row_id}"
     try:
-        response = requests.get(api_url, headers=headers)
+        response = http_client.get_session().get(api_url, headers=headers)
         log_debug_info(response, row_id = row_id, name = "pull_row_data function")
         response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
         return response.json()
@@ -150,162 +658,352 @@ def pull_row_data(api_url, headers, row_id):
         logging.error(f"Error occurred: {e}")
         return None
 
-#Sends a http POST request to create a new row.
+#Sends a http POST request to create new rows, data is a list of rows.
+#Partial success lets the good rows through when one row in the list is rejected.
+@instrumentation.timed("create_row")
 def create_row(api_url, headers, data):
-    api_url = f"{api_url}/rows"
+    api_url = f"{api_url}/rows?allowPartialSuccess=true"
     try:
-        response = requests.post(api_url, headers=headers, json=data)
+        response = http_client.get_session().post(api_url, headers=headers, json=data)
         log_debug_info(response, data = data, name = "create_row function")
         response.raise_for_status()
+        return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Error occurred: {e}")
         return None
 
 #Sends a http PUT request to update all elements in a row.
-def update_row(api_url, headers, data, row_id):
-    api_url = f"{api_url}/rows/{row_id}"
+#Without a row_id, data is a list of rows (each carrying its id) updated in one request.
+@instrumentation.timed("update_row")
+def update_row(api_url, headers, data, row_id = None):
+    if row_id is None:
+        api_url = f"{api_url}/rows?allowPartialSuccess=true"
+    else:
+        api_url = f"{api_url}/rows/{row_id}"
     try:
-        response = requests.put(api_url, headers = headers, json = data)
+        response = http_client.get_session().put(api_url, headers = headers, json = data)
         log_debug_info(response, row_id = row_id, data = data, name = "update_row function")
         response.raise_for_status()
+        return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Error occurred: {e}")
         return None
 
-#Sends a http DELETE request to delete a row.
+#Sends a http DELETE request to delete rows, params is a comma separated list of row ids.
+@instrumentation.timed("delete_row")
 def delete_row(api_url, headers, params):
     try:
         deletion_url = f"{api_url}/rows?ids={params}"
-        response = requests.delete(deletion_url, headers = headers, data = "")
+        response = http_client.get_session().delete(deletion_url, headers = headers, data = "")
         log_debug_info(response, row_id = params, name = "delete_row function")
         response.raise_for_status()
+        return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Error occurred: {e}")
+        return None
 
-#Sends a http POST request to move a row from one sheet to another.
+#Sends a http POST request to move rows from one sheet to another, row_id can be a single id or a list.
 #This is used to maintain data integrity and make sure things don't get lost.
-def archive_row(api_url, headers, row_id):
+@instrumentation.timed("archive_row")
+def archive_row(api_url, headers, row_id, archive_sheet_id):
     try:
         archive_url = f"{api_url}/rows/move"
+        row_ids = row_id if isinstance(row_id, list) else [row_id]
         #The sheetID referenced in the next statement is the archive sheet
-        payload = json.dumps({"rowIds" : [row_id], "to" : {"sheetId" : "*exampleColumnId*"}}) #Archive sheet id
-        response = requests.post(archive_url, headers = headers, data = payload)
+        payload = json.dumps({"rowIds" : row_ids, "to" : {"sheetId" : archive_sheet_id}}) #Archive sheet id
+        response = http_client.get_session().post(archive_url, headers = headers, data = payload)
         log_debug_info(response, row_id = row_id, name = "archive_row function")
         response.raise_for_status()
+        return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Error occurred: {e}")
+        return None
+
+#Sends a request on the asyncio client, logging and failing like the functions above: errors are logged and None comes back.
+async def send_request_async(client, name, method, api_url, headers, data = None, row_id = None):
+    try:
+        response = await client.request(method, api_url, headers = headers, json = data)
+        log_debug_info(response, row_id = row_id, data = data, name = f"{name} function")
+        response.raise_for_status()
+        return response.json()
+    except client.errors as e:
+        logging.error(f"Error occurred: {e}")
+        return None
+
+#Async versions of the bulk row requests, used by RowBatch with --async. Each takes a chunk of rows or row ids.
+@instrumentation.timed("create_row")
+async def create_row_async(client, api_url, headers, rows):
+    return await send_request_async(client, "create_row", "POST", f"{api_url}/rows?allowPartialSuccess=true", headers, data = rows)
+
+@instrumentation.timed("update_row")
+async def update_row_async(client, api_url, headers, rows):
+    return await send_request_async(client, "update_row", "PUT", f"{api_url}/rows?allowPartialSuccess=true", headers, data = rows)
+
+@instrumentation.timed("delete_row")
+async def delete_row_async(client, api_url, headers, row_ids):
+    params = ",".join(str(row_id) for row_id in row_ids)
+    return await send_request_async(client, "delete_row", "DELETE", f"{api_url}/rows?ids={params}", headers, row_id = params)
+
+@instrumentation.timed("archive_row")
+async def archive_row_async(client, api_url, headers, row_ids, archive_sheet_id):
+    payload = {"rowIds" : row_ids, "to" : {"sheetId" : archive_sheet_id}}
+    return await send_request_async(client, "archive_row", "POST", f"{api_url}/rows/move", headers, data = payload, row_id = row_ids)
 
 #Sends a http POST request have rows be sorted by specific columns.
-def sort_rows(api_url, headers):
+@instrumentation.timed("sort_rows")
+def sort_rows(api_url, headers, columns):
     api_url = f"{api_url}/sort"
     data = json.dumps({
-        "sortCriteria": [
-        {
-          "columnId": "*exampleColumnId*", #Hire date
-          "direction": "DESCENDING"
-        },
-        { "columnId": "*exampleColumnId*", #Title
-          "direction": "DESCENDING"
-        },
-        { "columnId": "*exampleColumnId*", #First name
-          "direction": "ASCENDING"
-        }
-      ]
+        "sortCriteria": [{"columnId": columns[name], "direction": direction} for name, direction in SORT_CRITERIA]
     })
 
     try:
-        response = requests.post(api_url, headers=headers, data=data)
+        response = http_client.get_session().post(api_url, headers=headers, data=data)
         log_debug_info(response, data = data, name = "sort_rows function")
         response.raise_for_status()
+        return response.json()
     except requests.exceptions.RequestException as e:
         logging.error(f"Error occurred: {e}")
+        return None
 
-#Moves old IT rows to the archive sheet
-def archive_old_it_rows(api_url, headers, old_rows):
-    for row in old_rows:
-        archive_row(api_url, headers, row.row_id)
-
-#Compares the hire dates for HR and IT. If they don't match, IT will adopt the HR date.
-def replace_mismatched_dates(api_url, headers, valid_hr_rows, valid_it_rows):
-    both_lists_emails = set(hr_row.pmail for hr_row in valid_hr_rows) & set(it_row.pmail for it_row in valid_it_rows)
-    for email in both_lists_emails:
-        hr_row = next(hr_row for hr_row in valid_hr_rows if hr_row.pmail == email)
-        it_row = next(it_row for it_row in valid_it_rows if it_row.pmail == email)     
-        if hr_row.hire_date != it_row.hire_date:
+#Puts the IT sheet in SORT_CRITERIA order with as few changes as it can, working from the run's snapshot.
+#Nothing is sent when the rows are already in order, and a few rows out of place are moved next to their neighbours.
+#The full sort is only posted when the snapshot went stale, the moves would take more than SORT_MOVE_LIMIT requests, or a move fails.
+#Returns True when a request was sent.
+def sort_sheet(api_url, headers, snapshot, chunk_size = DEFAULT_CHUNK_SIZE):
+    if not snapshot.stale:
+        target = snapshot.sorted_rows(SORT_CRITERIA)
+        moves = plan_sort_moves([row['id'] for row in snapshot.data['rows']], [row['id'] for row in target], chunk_size)
+        if moves is not None:
+            if all(snapshot.confirm(update_row(api_url, headers, chunk)) for chunk in moves):
+                snapshot.data['rows'] = target
+                return len(moves) > 0
+            logging.warning("Moving rows into order failed, sorting the whole sheet instead.")
+    if snapshot.confirm(sort_rows(api_url, headers, snapshot.columns)):
+        snapshot.sort(SORT_CRITERIA)
+    return True
+
+#Works out the row moves that turn the current_ids order into sorted_ids, as chunks of bulk update payloads.
+#The longest run of rows already in the right order relative to each other stays put. Every other row is moved
+#below the row it follows in sorted_ids, or to the top, and rows that follow each other share one request.
+#Returns [] when the order is already right, and None when it would take more than limit requests.
+def plan_sort_moves(current_ids, sorted_ids, chunk_size = DEFAULT_CHUNK_SIZE, limit = SORT_MOVE_LIMIT):
+    positions = {row_id: position for position, row_id in enumerate(sorted_ids)}
+    staying = longest_increasing(positions[row_id] for row_id in current_ids)
+    moves = []
+    run = []
+    for position, row_id in enumerate(sorted_ids + [None]):
+        if position not in staying and row_id is not None:
+            run.append(row_id)
+            continue
+        #Each chunk goes below the last row of the one before it, so a long run stays in one piece.
+        anchor = sorted_ids[position - len(run) - 1] if position > len(run) else None
+        for chunk in chunked(run, max(1, chunk_size)):
+            location = {"siblingId": anchor} if anchor is not None else {"toTop": True}
+            moves.append([{"id": row_id, **location} for row_id in chunk])
+            anchor = chunk[-1]
+            if len(moves) > limit:
+                return None
+        run = []
+    return moves
+
+#Values on one longest strictly increasing subsequence, found in O(n log n) by patience sorting.
+def longest_increasing(values):
+    tails = [] #Smallest last value of an increasing subsequence of each length.
+    previous = {}
+    for value in values:
+        length = bisect.bisect_left(tails, value)
+        previous[value] = tails[length - 1] if length else None
+        if length == len(tails):
+            tails.append(value)
+        else:
+            tails[length] = value
+    chain = set()
+    value = tails[-1] if tails else None
+    while value is not None:
+        chain.add(value)
+        value = previous[value]
+    return chain
+
+#Diff between the HR and IT sheets, worked out once per run.
+#Holds every change a sync needs so it can be inspected before it is applied.
+class SyncPlan(object):
+    """Init Constructor"""
+    def __init__(self):
+        self.archives = [] #Old IT rows to move to the archive sheet.
+        self.date_updates = [] #(IT row, HR hire date) pairs.
+        self.deletes = [] #IT rows no longer on the HR sheet.
+        self.creates = [] #HR rows missing from the IT sheet.
+        self.color_fixes = [] #(IT row, majority color) pairs, filled in after the sort.
+
+    #Counts of each kind of change.
+    def summary(self):
+        return {
+            "archives": len(self.archives),
+            "date_updates": len(self.date_updates),
+            "deletes": len(self.deletes),
+            "creates": len(self.creates),
+            "color_fixes": len(self.color_fixes)
+        }
 
+    #Human readable list of the changes, used by --plan.
+    def describe(self):
+        lines = [f"{name}: {count}" for name, count in self.summary().items()]
+        lines += [f"  archive {row.pmail} ({row.hire_date})" for row in self.archives]
+        lines += [f"  date {row.pmail} {row.hire_date} -> {hire_date}" for row, hire_date in self.date_updates]
+        lines += [f"  delete {row.pmail}" for row in self.deletes]
+        lines += [f"  create {row.pmail} ({row.hire_date})" for row in self.creates]
+        lines += [f"  color {row.pmail} -> {color}" for row, color in self.color_fixes]
+        return "\n".join(lines)
+
+    #IT rows that stay on the sheet after the plan is applied.
+    def remaining_it_rows(self, valid_it_rows):
+        deleted = {id(row) for row in self.deletes}
+        return [row for row in valid_it_rows if id(row) not in deleted]
+
+    #Queues the archives, date fixes, deletes and creates on the batch.
+    #Date fixes are also applied to the IT rows in memory so later stages see the HR date.
+    def apply_rows(self, batch, color_state, columns):
+        for row in self.archives:
+            batch.move(row.row_id)
+        for it_row, hire_date in self.date_updates:
             payload = {
               "cells": [
                 {
-                  "columnId": "*exampleColumnId*",#hire date column id
-                  "value": hr_row.hire_date 
+                  "columnId": columns["hire_date"],#hire date column id
+                  "value": hire_date 
                 }
               ]
             }
+            batch.update(it_row.row_id, payload)
+            it_row.hire_date = hire_date
+        for row in self.deletes:
+            batch.delete(row.row_id)
+        for row, color in zip(self.creates, color_state.assign_all(self.creates)):
+            batch.create(row.to_json(color, columns))
+
+#Builds the sync plan by indexing both sheets by personal email (pmail), which is the primary key.
+#Old IT rows get archived, IT rows not on HR get deleted, HR rows not on IT get created,
+#and when both have the row but the hire dates don't match, IT will adopt the HR date.
+def reconcile(valid_hr_rows, valid_it_rows, old_it_rows):
+    plan = SyncPlan()
+    plan.archives = list(old_it_rows)
+
+    hr_by_pmail = {}
+    for hr_row in valid_hr_rows:
+        hr_by_pmail.setdefault(hr_row.pmail, hr_row)
+    it_by_pmail = {}
+    for it_row in valid_it_rows:
+        it_by_pmail.setdefault(it_row.pmail, it_row)
 
-            update_row(api_url, headers, payload, it_row.row_id)
-
-#It is messy but I just can't deal with the colors anymore.
-#If one row has it's color changed doesn't have the same color as the rest that share a date, it will adopt the color of the majority for that date.
-def update_colors_for_it_rows(api_url, headers, valid_it_rows):
-    ids_to_colors, date_color_count_dict = get_all_rows_color(api_url, headers)
     for it_row in valid_it_rows:
+        hr_row = hr_by_pmail.get(it_row.pmail)
+        if hr_row is None:
+            plan.deletes.append(it_row)
+        elif it_by_pmail[it_row.pmail] is it_row and hr_row.hire_date != it_row.hire_date:
+            plan.date_updates.append((it_row, hr_row.hire_date))
+
+    plan.creates = [hr_row for hr_row in valid_hr_rows if hr_row.pmail not in it_by_pmail]
+    return plan
+
+#Fills in plan.color_fixes: every IT row staying on the sheet whose color isn't the majority color of its hire date in snapshot.
+def find_color_fixes(plan, valid_it_rows, snapshot):
+    ids_to_colors, date_color_count_dict = get_all_rows_color(snapshot.data, snapshot.columns)
+    for it_row in plan.remaining_it_rows(valid_it_rows):
         current_color = ids_to_colors.get(it_row.row_id, None)
         highest_color = get_highest_color(date_color_count_dict, it_row.hire_date)
 
         if current_color != highest_color:
-            updated_color = highest_color
-            row_to_fix = pull_row_data(api_url, headers, it_row.row_id)
-
-            cell_list = [
-                    {
-                        "columnId" : cell['columnId'],
-                        "value" : cell['value'] if cell.get('value') else "",
-                        "format" : f",,,,,,2,,,{updated_color},,,,,,",
-                        "strict": "false"
-                    }
-                for cell in row_to_fix['cells']
-                ]
-
-            payload = {"cells" : cell_list}
-            update_row(api_url, headers, payload, it_row.row_id)
+            plan.color_fixes.append((it_row, highest_color))
 
-#Datetime helper for figuring out when to set cutoffs for dates on sheets.
-def date_calculations(data):
-    json_dt = datetime.strptime(data, '%Y-%m-%d')
-    # Get the current datetime
-    current_dt = datetime.now()
-    # Calculate the time difference
-    time_difference = current_dt - json_dt
-    return time_difference
-
-#Helper to find the value of a specific cell
-def find_value_by_column_id(row, column_id, format_mode = False):
-    for cell in row:
-        if cell['columnId'] == int(column_id):
-            try:
-                if format_mode:
-                    return cell['format']
-                return cell['value']
-            except KeyError:
-                return None
-    return None
+#It is messy but I just can't deal with the colors anymore.
+#If one row has it's color changed doesn't have the same color as the rest that share a date, it will adopt the color of the majority for that date.
+#Colors and cells are read from the run's snapshot, which is only downloaded again if it went stale.
+def update_colors_for_it_rows(api_url, headers, plan, valid_it_rows, batch, snapshot, cache = None):
+    if snapshot.stale:
+        format_url = f"{api_url}?include=format"
+        if cache:
+            cache.invalidate(format_url)
+        it_data = pull_data_cached(format_url, headers, cache) if cache else pull_data(format_url, headers)
+        snapshot = SheetSnapshot(it_data, snapshot.columns)
+    find_color_fixes(plan, valid_it_rows, snapshot)
+
+    for it_row, updated_color in plan.color_fixes:
+        row_to_fix = snapshot.rows_by_id.get(it_row.row_id) or pull_row_data(api_url, headers, it_row.row_id)
+
+        cell_list = [
+                {
+                    "columnId" : cell['columnId'],
+                    "value" : cell['value'] if cell.get('value') else "",
+                    "format" : f",,,,,,2,,,{updated_color},,,,,,",
+                    "strict": "false"
+                }
+            for cell in row_to_fix['cells']
+            ]
 
-#Logging function
-def log_debug_info(response, row_id=None, name=None, data=None):
+        payload = {"cells" : cell_list}
+        batch.update(it_row.row_id, payload)
+
+#Parses a sheet date into a day number. Sheets repeat the same few dates a lot, so each one is only parsed once.
+@functools.lru_cache(maxsize = 4096)
+def date_ordinal(text):
+    try:
+        return date.fromisoformat(text).toordinal()
+    except ValueError:
+        return datetime.strptime(text, '%Y-%m-%d').toordinal()
 
-    if row_id is not None:
-        logging.debug(f"Row id: {row_id}")
-    if name is not None:
-        logging.debug(f"Name: {name}")
-    if data is not None:
-        logging.debug(f"Data: {data}")
-    if response is not None:
-        logging.debug(f"Response Status: {response.status_code}")
+#Datetime helper for figuring out when to set cutoffs for dates on sheets.
+#Takes "now" once, so every row of a run is judged against the same moment.
+class HireDateWindow(object):
+    __slots__ = ("today", "archive_before")
 
-    logging.debug(f"Traceback: {traceback.format_exc()}")
+    """Init Constructor"""
+    def __init__(self, now = None):
+        now = now or datetime.now()
+        #Hire dates are midnights: one is still to come when its day is after today,
+        #and it is more than three days past when midnight falls before now minus three days.
+        self.today = now.toordinal()
+        cutoff = now - timedelta(days = 3)
+        self.archive_before = cutoff.toordinal() + (cutoff.time() != day_start())
+
+    def is_future(self, row):
+        return row.hire_ordinal is not None and row.hire_ordinal > self.today
+
+    #Buckets rows into future hires, active rows and rows old enough to archive, keeping their order.
+    #Rows without a hire date go in none of them.
+    def classify(self, rows):
+        future, active, archive = [], [], []
+        today, archive_before = self.today, self.archive_before
+        for row in rows:
+            ordinal = row.hire_ordinal
+            if ordinal is None:
+                continue
+            if ordinal > today:
+                future.append(row)
+            elif ordinal < archive_before:
+                archive.append(row)
+            else:
+                active.append(row)
+        return future, active, archive
 
-    args = argument_checker()
-    if args.verbose:
+#Logging function
+#Nothing is formatted unless debug logging is on, the payloads can be hundreds of rows.
+def log_debug_info(response, row_id=None, name=None, data=None):
+    context = get_context()
+    if context.debug:
+        logger = context.logger
+        if row_id is not None:
+            logger.debug("Row id: %s", row_id)
+        if name is not None:
+            logger.debug("Name: %s", name)
+        if data is not None:
+            logger.debug("Data: %s", data)
+        if response is not None:
+            logger.debug("Response Status: %s", response.status_code)
+        if sys.exc_info()[0] is not None:
+            logger.debug("Traceback: %s", traceback.format_exc())
+
+    if context.verbose and response is not None:
         print(f"Response Status: {response.status_code}")
 
 #Color helper functions
@@ -334,20 +1032,19 @@ def get_highest_color(date_color_count_dict, date):
     else:
         return None
 
-def get_all_rows_color(api_url, headers):
+#it_data has to be pulled with ?include=format.
+def get_all_rows_color(it_data, columns):
     color_map = {}
     ids_to_colors = {}
-    api_url += "?include=format"
-    it_data = pull_data(api_url, headers)
 
     rows_with_dates_colors = [
         {
-            'date': find_value_by_column_id(row['cells'], '*exampleColumnId*'), #date
-            'color': [value for value in find_value_by_column_id(row['cells'], '*exampleColumnId*', True).split(',') if value][-1], #date
-            'id': row['id']
+            'date': row.value("hire_date"), #date
+            'color': [value for value in row.format("hire_date").split(',') if value][-1], #date
+            'id': row.id
         }
-        for row in it_data['rows']
-        if find_value_by_column_id(row['cells'], '*exampleColumnId*') #pmail exists
+        for row in sheet_rows(it_data, columns)
+        if row.value("pmail") #pmail exists
     ]
 
     date_color_count_dict = generate_date_color_count(rows_with_dates_colors)
@@ -356,97 +1053,187 @@ def get_all_rows_color(api_url, headers):
     return ids_to_colors, date_color_count_dict
 
 #Grabs all the rows from the HR sheet and turns them into IT_Row objects
-def clean_data_based_on_dates_hr(data):
-    rows_to_add = [
-        IT_Row(
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Date
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #First
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Last
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Title
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Office
-            find_value_by_column_id(row['cells'], '*exampleColumnId*') #pmail
-        )
-        for row in data['rows']
-        #if pmail and date has not passed
-        if find_value_by_column_id(row['cells'], '*exampleColumnId*') and date_calculations(find_value_by_column_id(row['cells'], '*exampleColumnId*')) < timedelta(days=0)
-    ]
+def clean_data_based_on_dates_hr(data, columns):
+    objects = (IT_Row.from_sheet_row(row) for row in sheet_rows(data, columns) if row.value("pmail"))
+    #if pmail and date has not passed
+    window = HireDateWindow()
+    rows_to_add = [row for row in objects if window.is_future(row)]
     return rows_to_add
 
 #Grabs all the rows from the IT sheet and turns them into IT_Row objects
-def clean_data_based_on_dates_it(data, return_need_to_delete = False):
-    objects = [
-        IT_Row(
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Date
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #First
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Last
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Title
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #Office
-            find_value_by_column_id(row['cells'], '*exampleColumnId*'), #pmail
-            row['id']
-        )
-            for row in data['rows']
-            if find_value_by_column_id(row['cells'], '*exampleColumnId*')
-        ]
+def clean_data_based_on_dates_it(data, columns, return_need_to_delete = False):
+    objects = (IT_Row.from_sheet_row(row, row.id) for row in sheet_rows(data, columns) if row.value("pmail"))
         
-    rows_to_add = [row for row in objects if date_calculations(row.hire_date) < timedelta(days=0)]
+    rows_to_add, _, old_rows = HireDateWindow().classify(objects)
     if return_need_to_delete:
-        old_rows = [row for row in objects if date_calculations(row.hire_date) > timedelta(days=3)]
         return rows_to_add, old_rows
     else:
         return rows_to_add
 
-#Makes sure that hr and it are working with the same data, uses personal email (pmail) as primary key.
-def compare_hr_it_emails(api_url, headers, valid_hr_rows, valid_it_rows):
-    # Condition 1: Check if an email is in valid_it_rows but not in valid_hr_rows  
-    it_rows_not_in_hr = [it_row for it_row in valid_it_rows if it_row.pmail not in {hr_row.pmail for hr_row in valid_hr_rows}]
-    for it_row in it_rows_not_in_hr:
-        delete_row(api_url, headers, it_row.row_id)
-
-    # Condition 2: Check if an email is in valid_hr_rows but not in valid_it_rows
-    hr_not_in_it_emails = [hr_row for hr_row in valid_hr_rows if hr_row.pmail not in {it_row.pmail for it_row in valid_it_rows}]
-    for hr_row in hr_not_in_it_emails:
-        create_row(api_url, headers, hr_row.to_json())
-
 #Main function that runs everything
 def main():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))#Added to make sure environment works correctly
 
     start_time = time.time()
-    api_key = check_api_key()
-    configure_logging()
+    context = init_context()
+    try:
+        pairs = load_pairs(context.args.config) if context.args.config else None
+    except (OSError, ValueError) as e:
+        sys.exit(f"Could not read the config: {e}")
+    api_key = check_api_key(context.args)
+    configure_logging(context.args)
+    instrumentation.reset()
+    #Every pair synced at once pulls its two sheets side by side, all through the one pool and rate limit.
+    concurrent_pairs = min(max(1, context.args.concurrent), len(pairs)) if pairs else 1
+    session = http_client.configure_session(pool_size = 2 * concurrent_pairs, timeout = context.args.timeout, rate_limit = context.args.rate_limit)
+    instrumentation.install(session)
+    try:
+        if pairs:
+            results = run_pairs(context, api_key, pairs, concurrent_pairs)
+        else:
+            results = [run_sync(context, api_key, SheetPair.from_constants())]
+            if results[0].status == "failed": #Failure to retrieve data
+                sys.exit(0)
+    finally:
+        if context.args.metrics:
+            instrumentation.write(context.args.metrics, "reliquery")
+    print("--- Program took %s seconds to execute ---" % (time.time() - start_time))
+    if pairs and any(result.status == "failed" for result in results):
+        sys.exit(1)
 
+#How the sync of one pair went.
+class PairResult(object):
+    __slots__ = ("name", "status", "summary", "seconds", "output")
+
+    """Init Constructor"""
+    def __init__(self, name, status, summary = None, seconds = 0.0, output = ""):
+        self.name = name
+        self.status = status #synced, unchanged, planned or failed.
+        self.summary = summary or {} #SyncPlan.summary() when the pair got as far as a plan.
+        self.seconds = seconds
+        self.output = output
+
+    def describe(self):
+        counts = ", ".join(f"{name} {count}" for name, count in self.summary.items())
+        return f"{self.name:<20}{self.status:<10}{self.seconds:>8.1f}s  {counts}"
+
+#Syncs every pair from --config, concurrent_pairs at a time, and prints each pair's output as it finishes followed by a summary.
+#A pair that fails is reported and the rest carry on.
+def run_pairs(context, api_key, pairs, concurrent_pairs):
+    def run_pair(pair):
+        output = io.StringIO()
+        start = time.time()
+        try:
+            result = run_sync(context, api_key, pair, output)
+        except Exception as e:
+            logging.exception(f"Sync of pair {pair.name} failed")
+            print(f"Sync failed: {e}", file = output)
+            result = PairResult(pair.name, "failed")
+        result.seconds = time.time() - start
+        result.output = output.getvalue()
+        return result
+
+    results = {}
+    with ThreadPoolExecutor(max_workers = concurrent_pairs) as pool:
+        for future in as_completed([pool.submit(run_pair, pair) for pair in pairs]):
+            result = future.result()
+            results[result.name] = result
+            print(f"[{result.name}]")
+            print(result.output.rstrip())
+    results = [results[pair.name] for pair in pairs]
+    print(f"{len(pairs)} pairs: " + ", ".join(f"{sum(result.status == status for result in results)} {status}"
+                                           for status in ("synced", "unchanged", "planned", "failed")))
+    for result in results:
+        print(result.describe())
+    return results
+
+#The sync of one pair, each stage is timed for the --metrics output. Progress is printed to messages, stdout by default.
+def run_sync(context, api_key, pair, messages = None):
+    messages = messages if messages is not None else sys.stdout
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Accept": "application/json",
         "Content-Type": "application/json"
     }
 
-    hr_url = "https://api.smartsheet.com/2.0/sheets/*hr_sheet_id*"
-    hr_data = pull_data(hr_url, headers)
-
-    it_url = "https://api.smartsheet.com/2.0/sheets/*it_sheet_id*"
-    it_data = pull_data(it_url, headers)
+    hr_url = pair.hr_url
+    it_url = pair.it_url
+    #The IT sheet is pulled once with formats, the color pass needs them.
+    it_format_url = f"{it_url}?include=format"
+
+    #Incremental mode checks the sheet versions first and only downloads what changed.
+    cache = SheetCache.load(pair.cache_file) if context.args.incremental else None
+    #The two sheets don't depend on each other, so the HR sheet is pulled on a second thread.
+    with instrumentation.stage("pull"), ThreadPoolExecutor(max_workers = 1) as pool:
+        if cache:
+            hr_version = pool.submit(pull_sheet_version, hr_url, headers)
+            versions = {"it": pull_sheet_version(it_url, headers), "hr": hr_version.result()}
+            if cache.unchanged_since_last_run(versions):
+                print("Nothing changed since the last run, skipping.", file = messages)
+                return PairResult(pair.name, "unchanged")
+            hr_pull = pool.submit(pull_data_cached, hr_url, headers, cache, versions["hr"])
+            it_data = pull_data_cached(it_format_url, headers, cache, versions["it"])
+        elif context.args.stream:
+            #HR rows are cleaned as they are parsed, so only the rows the sync needs are ever held.
+            hr_pull = pool.submit(pull_data_streaming, hr_url, headers, functools.partial(clean_data_based_on_dates_hr, columns = pair.hr_columns))
+            it_data = pull_data_streaming(it_format_url, headers, json_stream.SheetStream.to_dict)
+        else:
+            hr_pull = pool.submit(pull_data, hr_url, headers)
+            it_data = pull_data(it_format_url, headers)
+        hr_data = hr_pull.result()
 
-    if hr_data and it_data:
-        print("Working... please wait")
+    if hr_data is not None and it_data:
+        print("Working... please wait", file = messages)
         #Main
-        valid_hr_rows = clean_data_based_on_dates_hr(hr_data)
-        valid_it_rows, delete_these_rows = clean_data_based_on_dates_it(it_data, True)
-
-        archive_old_it_rows(it_url, headers, delete_these_rows) 
-        replace_mismatched_dates(it_url, headers, valid_hr_rows, valid_it_rows)
-
-        valid_it_rows= clean_data_based_on_dates_it(pull_data(it_url, headers))
-        compare_hr_it_emails(it_url, headers, valid_hr_rows, valid_it_rows)
-        sort_rows(it_url, headers)
-        update_colors_for_it_rows(it_url, headers, valid_it_rows)
+        with instrumentation.stage("clean"):
+            #Streamed HR data arrives already cleaned.
+            valid_hr_rows = hr_data if isinstance(hr_data, list) else clean_data_based_on_dates_hr(hr_data, pair.hr_columns)
+            valid_it_rows, delete_these_rows = clean_data_based_on_dates_it(it_data, pair.it_columns, True)
+
+        with instrumentation.stage("compare"):
+            plan = reconcile(valid_hr_rows, valid_it_rows, delete_these_rows)
+        if context.args.plan:
+            #Nothing is sent, so the color fixes are worked out from the sheet as it is now.
+            #A real run looks again after its changes, which can add fixes for the dates it touched.
+            find_color_fixes(plan, valid_it_rows, SheetSnapshot(it_data, pair.it_columns))
+            print(plan.describe(), file = messages)
+            if cache:
+                cache.save()
+            return PairResult(pair.name, "planned", plan.summary())
+
+        batch = RowBatch(pair.archive_sheet_id, context.args.batchsize, context.args.use_async)
+        color_state = ColorState.load(pair.color_file)
+        snapshot = SheetSnapshot(it_data, pair.it_columns)
+        #Archives, date fixes, deletes and new rows all go out in one set of bulk requests.
+        with instrumentation.stage("apply"):
+            plan.apply_rows(batch, color_state, pair.it_columns)
+            batch.flush(it_url, headers, snapshot)
+            color_state.keep(batch.created)
+        with instrumentation.stage("sort"):
+            sorted_sheet = sort_sheet(it_url, headers, snapshot, context.args.batchsize)
+        with instrumentation.stage("color"):
+            update_colors_for_it_rows(it_url, headers, plan, valid_it_rows, batch, snapshot, cache)
+            batch.flush(it_url, headers, snapshot)
+            color_state.save()
+        if cache:
+            #A change that didn't go through has to be tried again, so the next run downloads the sheet instead of skipping.
+            if snapshot.stale:
+                cache.invalidate(it_format_url)
+                cache.forget_run()
+            #Changes made by this run can leave more work behind, like the colors of the new rows, so only a run
+            #that sent nothing is recorded. The next run then goes through once more and settles the sheet.
+            elif sorted_sheet or any(plan.summary().values()):
+                cache.forget_run()
+            else:
+                cache.record_run(versions)
+            cache.save()
 
 
     else: #Failure to retrieve data
-        print("Could not retrieve data! Please check that the website is up and that the API key hasn't expired.")
-        sys.exit(0)
-    print("Sheet refresh finished!")
-    print("--- Program took %s seconds to execute ---" % (time.time() - start_time))
+        print("Could not retrieve data! Please check that the website is up and that the API key hasn't expired.", file = messages)
+        return PairResult(pair.name, "failed")
+    print("Sheet refresh finished!", file = messages)
+    return PairResult(pair.name, "synced", plan.summary())
 
 if __name__ == "__main__":
     main()
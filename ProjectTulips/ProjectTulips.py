@@ -1,47 +1,165 @@
 import requests
 import json
 import csv
+import gzip
 import sys
 import argparse
 from datetime import datetime, timedelta
 import time
+import os
+import heapq
+from collections import deque
+from itertools import chain, islice
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+#The shared client lives one folder up so both projects use the same pooled session.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from Shared import http_client, async_client, response_cache
+from Shared.atomic_file import write_file_atomically
+
+#Api url of your Snipe-IT server, e.g. https://snipe.example.com/api/v1
+API_URL = "*API_URL*"
+
+#Where watch mode keeps the newest activity entry it has written out, so a restart carries on from there.
+CURSOR_FILE = '.tulips_cursor.json'
+
+#Statuses the hardware report keeps, as Snipe-IT's ?status= filter and the status_meta of the rows it returns.
+#Everything deployed or archived is left on the server.
+HARDWARE_STATUSES = [("RTD", "deployable"), ("Pending", "pending"), ("Undeployable", "undeployable")]
+
+#Snipe-IT's default asset order, newest first. Every hardware query asks for it so the status queries can be merged back into it.
+HARDWARE_ORDER = {"sort": "created_at", "order": "desc"}
+
+#Reports the script makes, by the flag that selects them: output name, api endpoint, columns and page size.
+#Reports on the same endpoint are made from one pass over it.
+REPORTS = {
+    "ci": {"name": "checkin", "endpoint": "reports/activity", "labels": ["id", "name", "action", "datetime"], "limit": 50},
+    "co": {"name": "checkout", "endpoint": "reports/activity", "labels": ["id", "name", "action", "datetime"], "limit": 50},
+    "d": {"name": "hardware", "endpoint": "hardware", "labels": ["id", "name", "asset_tag", "serial", "model", "status"], "limit": 500}
+}
 
 def argument_checker():
     argParser = argparse.ArgumentParser()
     argParser.add_argument("-a", "--apikey", type = str, required = True, help = "Add API Key")
-    argParser.add_argument("-o", "--output", type = str, help = "Output file name")
+    argParser.add_argument("-o", "--output", type = str, help = "Output file name, - writes to stdout. With several reports each gets _<report> added")
+    argParser.add_argument("-f", "--format", choices = ["csv", "jsonl", "csv.gz", "parquet"], default = "csv", help = "Output format (default = csv)")
     argParser.add_argument("-ci", "--checkin", action = 'store_true', help = "Checkin report")
     argParser.add_argument("-co", "--checkout", action = 'store_true', help = "Checkout report")
     argParser.add_argument("-d", "--hardware", action = 'store_true', help = "Avaliable device report")
     argParser.add_argument("-t", "--timeperiod", type = int, default = 7, help = "time period for reports in days (default = 7)")
+    argParser.add_argument("-w", "--workers", type = int, default = 4, help = "Number of pages fetched at the same time (default = 4)")
+    argParser.add_argument("--timeout", type = float, default = http_client.DEFAULT_TIMEOUT, help = "Seconds to wait on the api before giving up (default = 60)")
+    argParser.add_argument("--async", dest = "use_async", action = 'store_true', help = "Fetch pages on one asyncio client instead of a thread pool, -w sets the requests in flight")
+    argParser.add_argument("--cache", type = str, help = "SQLite file to cache api responses in between runs")
+    argParser.add_argument("--cache-ttl", type = int, default = response_cache.DEFAULT_TTL, help = "Seconds a cached hardware page is used without asking the api (default = 3600)")
+    argParser.add_argument("--cache-size", type = int, default = response_cache.DEFAULT_MAX_SIZE // (1024 * 1024), help = "MiB of cached pages kept (default = 256)")
+    argParser.add_argument("--watch", type = float, help = "Keep running and append new check-ins/check-outs to daily files every this many seconds")
+    argParser.add_argument("--cursor", type = str, default = CURSOR_FILE, help = "File watch mode keeps its place in the activity log in (default = .tulips_cursor.json)")
     args = argParser.parse_args()
     return args
 
-#Ask the api
+#Adds the paging parameters to a report url, which may already carry filters.
+def page_url(api_url, offset, limit):
+    separator = '&' if '?' in api_url else '?'
+    return f"{api_url}{separator}offset={offset}&limit={limit}"
+
+#Ask the api, through the response cache when there is one
 def ping_api(api_url, headers):
+    cache = response_cache.get_cache()
     try:
-        response = requests.get(api_url, headers=headers)
+        if cache is not None:
+            return json.loads(cache.fetch(http_client.get_session(), api_url, headers))
+        response = http_client.get_session().get(api_url, headers=headers)
         response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
         data = response.json()  # Assuming the API returns JSON data
         return data
-    except requests.exceptions.RequestException as e:
-        print(f"Error occurred: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"Error occurred: {e}", file = sys.stderr)
         return None
 
-#Save an item and its properties
-def save_row(file, writer, paged_data, k, report):
+#A page that still fails after the session's retries would leave a hole in the report, so the run stops instead of skipping it.
+def required_page(data):
+    if not data:
+        print("Could not retrieve part of the report! Please check that the website is up and that the API key hasn't expired.", file = sys.stderr)
+        sys.exit(1)
+    return data
+
+#Fetches pages at the given offsets at the same time, on pool when given (a ThreadPoolExecutor from page_pool).
+#Pages are yielded in offset order, and only a few pages per worker are held in memory.
+def fetch_pages(api_url, headers, offsets, limit, workers, pool = None):
+    workers = max(1, workers)
+    if pool is None:
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            yield from fetch_pages(api_url, headers, offsets, limit, workers, executor)
+        return
+    pending = deque()
+    for offset in offsets:
+        pending.append(pool.submit(ping_api, page_url(api_url, offset, limit), headers))
+        if len(pending) >= workers * 2:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+#Async version of ping_api, sharing one client across every page of the report.
+async def ping_api_async(client, api_url, headers):
+    cache = response_cache.get_cache()
+    try:
+        if cache is not None:
+            return json.loads(await cache.fetch_async(client, api_url, headers))
+        response = await client.get(api_url, headers = headers)
+        response.raise_for_status()
+        return response.json()
+    except client.errors + (ValueError,) as e:
+        print(f"Error occurred: {e}", file = sys.stderr)
+        return None
+
+#Async version of fetch_pages. Every page request goes through one client whose semaphore
+#allows workers requests in flight, and pages are still yielded in offset order.
+#pool is an async_client.SharedLoop from page_pool, when the client is shared with other reads.
+def fetch_pages_async(api_url, headers, offsets, limit, workers, pool = None):
+    workers = max(1, workers)
+    client = pool.client if pool is not None else async_client.build_client(concurrency = workers, timeout = http_client.get_session().timeout)
+    requests_for_pages = (ping_api_async(client, page_url(api_url, offset, limit), headers) for offset in offsets)
+    yield from async_client.ordered_results(requests_for_pages, workers * 2, client, pool)
+
+#Picks how the report's pages are fetched, the thread pool or the asyncio client.
+def page_fetcher(args):
+    return fetch_pages_async if args.use_async else fetch_pages
+
+#One thread pool, or one asyncio client and loop, for page reads that run side by side,
+#so all of them together keep to args.workers requests in flight.
+@contextmanager
+def page_pool(args):
+    workers = max(1, args.workers)
+    if args.use_async:
+        pool = async_client.SharedLoop(async_client.build_client(concurrency = workers, timeout = http_client.get_session().timeout))
+        try:
+            yield pool
+        finally:
+            pool.close()
+    else:
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            yield pool
+
+#Turns an item into a report row
+def format_row(item, report):
     row = []
     if (report.lower() == 'd' or report.lower() == 'h'):
-        row.append(paged_data["rows"][k]["id"])
-        row.append(paged_data["rows"][k]["name"])
-        row.append(paged_data["rows"][k]["asset_tag"])
-        row.append(paged_data["rows"][k]["serial"])
-        if (paged_data["rows"][k]["model"]["name"] and paged_data["rows"][k]["model_number"]):
-            row.append(paged_data["rows"][k]["model"]["name"] + paged_data["rows"][k]["model_number"])
-        row.append(paged_data["rows"][k]["status_label"]["status_meta"])
+        row.append(item["id"])
+        row.append(item["name"])
+        row.append(item["asset_tag"])
+        row.append(item["serial"])
+        #The model cell is always there so the columns line up with the labels, empty when the model is incomplete.
+        if (item["model"]["name"] and item["model_number"]):
+            row.append(item["model"]["name"] + item["model_number"])
+        else:
+            row.append(None)
+        row.append(item["status_label"]["status_meta"])
         
     elif (report.lower() == 'ci' or report.lower() == 'co'):
-        id = paged_data["rows"][k]["item"]["id"]
+        id = item["item"]["id"]
         if (id > 722):
             if(len(str(id))==3):
                 row.append('\'00'+str(id))
@@ -49,13 +167,138 @@ def save_row(file, writer, paged_data, k, report):
                 row.append('\'0'+str(id))
         else:
             row.append('\'' + str(id-2))
-        row.append(paged_data["rows"][k]["item"]["name"])
-        row.append(paged_data["rows"][k]["action_type"])
-        row.append(paged_data["rows"][k]["action_date"]["datetime"])
+        row.append(item["item"]["name"])
+        row.append(item["action_type"])
+        row.append(item["action_date"]["datetime"])
     else:
-        print("Invalid report argument")
-        return
-    writer.writerow(row)
+        print("Invalid report argument", file = sys.stderr)
+        return None
+    return row
+
+#Row transform stage: turns a page of items into one report's rows, dropping the ones the report doesn't want.
+def report_rows(items, report):
+    if report == 'd':
+        return [format_row(item, 'd') for item in items if item["status_label"]["status_meta"] not in ("deployed", "archived")]
+    action_type = "checkin from" if report == 'ci' else "checkout"
+    return [format_row(item, report) for item in items if item["action_type"] == action_type]
+
+#Output sinks. Each one is handed a page of rows at a time and writes it in bulk.
+class CsvSink(object):
+    def __init__(self, file, labels, header = True):
+        self.file = file
+        self.writer = csv.writer(file)
+        if header:
+            self.writer.writerow(labels)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        close_output(self.file)
+
+class JsonLinesSink(object):
+    def __init__(self, file, labels, header = True):
+        self.file = file
+        self.labels = labels
+
+    def write_rows(self, rows):
+        self.file.write("".join(json.dumps(dict(zip(self.labels, row))) + "\n" for row in rows))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        close_output(self.file)
+
+#Columnar output, only available when pyarrow is installed. Every column is stored as a string.
+class ParquetSink(object):
+    def __init__(self, path, labels):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print("Parquet output needs pyarrow, install it with: pip install pyarrow")
+            sys.exit(1)
+        self.pyarrow = pyarrow
+        self.labels = labels
+        self.schema = pyarrow.schema([(label, pyarrow.string()) for label in labels])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        columns = [[] for label in self.labels]
+        for row in rows:
+            for i, column in enumerate(columns):
+                column.append(str(row[i]) if i < len(row) and row[i] is not None else None)
+        self.writer.write_table(self.pyarrow.Table.from_arrays([self.pyarrow.array(column, self.pyarrow.string()) for column in columns], schema = self.schema))
+
+    def close(self):
+        self.writer.close()
+
+#File extension of each output format.
+OUTPUT_FORMATS = {"csv": ".csv", "jsonl": ".jsonl", "csv.gz": ".csv.gz", "parquet": ".parquet"}
+
+#Opens the sink for the chosen format. An output of "-" writes to stdout for piping.
+#With append the rows are added to the end of the file, and the header is only written to a new file.
+def open_sink(filename, output_format, labels, append = False):
+    to_stdout = filename == "-"
+    if output_format == "parquet":
+        if to_stdout:
+            print("Parquet output can't be written to stdout, please give a file name.")
+            sys.exit(1)
+        return ParquetSink(filename, labels)
+    header = to_stdout or not append or not os.path.exists(filename) or os.path.getsize(filename) == 0
+    mode = "a" if append else "w"
+    if output_format == "csv.gz":
+        file = gzip.open(sys.stdout.buffer if to_stdout else filename, mode + "t", newline='')
+    else:
+        file = sys.stdout if to_stdout else open(filename, mode, newline='')
+    if output_format == "jsonl":
+        return JsonLinesSink(file, labels, header)
+    return CsvSink(file, labels, header)
+
+#Sink that appends rows to one file per day, named after the day of each row's datetime, e.g. output_2024-05-01.csv.
+#Rows come in oldest first, so a file is closed once the rows move on to the next day.
+class RollingSink(object):
+    def __init__(self, filename, output_format, labels):
+        extension = OUTPUT_FORMATS[output_format]
+        self.base = filename[:-len(extension)]
+        self.extension = extension
+        self.output_format = output_format
+        self.labels = labels
+        self.day = None
+        self.sink = None
+
+    def write_rows(self, rows):
+        for row in rows:
+            day = row[3][:10]
+            if day != self.day:
+                if self.sink is not None:
+                    self.sink.close()
+                self.day = day
+                self.sink = open_sink(f"{self.base}_{day}{self.extension}", self.output_format, self.labels, append = True)
+            self.sink.write_rows([row])
+
+    def flush(self):
+        if self.sink is not None:
+            self.sink.flush()
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+            self.day = None
+
+#Closes an output file, stdout is only flushed.
+def close_output(file):
+    if file is sys.stdout:
+        file.flush()
+    else:
+        file.close()
 
 def date_calculations(data, i):
     json_dt = datetime.strptime(data["rows"][i]["action_date"]["datetime"], '%Y-%m-%d %H:%M:%S')
@@ -65,65 +308,302 @@ def date_calculations(data, i):
     time_difference = current_dt - json_dt
     return time_difference
 
-def csv_file_check(csv_filename):
-    if not csv_filename:
-        csv_filename = "output.csv"
-    if not csv_filename.endswith(".csv"):
-        csv_filename += ".csv"
-    return csv_filename
+#Counts the leading rows of a page that are inside the time period.
+#Rows are newest first, so the count stops at the first row that is too old.
+def rows_in_time_period(data, timeperiod):
+    for i in range(len(data["rows"])):
+        if date_calculations(data, i) >= timedelta(days=timeperiod):
+            return i
+    return len(data["rows"])
+
+#Checks if the last row of a page is still inside the time period, asking the api for that row only.
+def page_in_time_period(api_url, headers, page, limit, total, timeperiod):
+    data = required_page(ping_api(page_url(api_url, min((page + 1) * limit, total) - 1, 1), headers))
+    if not data["rows"]:
+        return False
+    return rows_in_time_period(data, timeperiod) == 1
 
+#Finds how many pages hold rows inside the time period.
+#Gallops out by doubling and then binary searches for the first page that ends outside the period,
+#so this costs O(log n) single row requests instead of walking the pages one by one.
+def count_pages_in_time_period(api_url, headers, total, limit, timeperiod):
+    page_count = -(-total // limit)
+    low, high, step = 0, page_count, 1
+    #Gallop: pages before low end inside the period, page high (if it exists) ends outside.
+    while low < page_count:
+        page = min(low + step, page_count) - 1
+        if page_in_time_period(api_url, headers, page, limit, total, timeperiod):
+            low = page + 1
+            step *= 2
+        else:
+            high = page
+            break
+    #Binary search between the last page known to be inside and the first known to be outside.
+    while low < high:
+        page = (low + high) // 2
+        if page_in_time_period(api_url, headers, page, limit, total, timeperiod):
+            low = page + 1
+        else:
+            high = page
+    return min(low + 1, page_count)
+
+#Output file of each report. A single report keeps the name it was given,
+#with several reports each one gets its name added, e.g. output_checkin.csv and output_checkout.csv.
+def output_file_check(filename, output_format, reports):
+    if filename == "-":
+        if len(reports) > 1:
+            print("Only one report can be written to stdout, please give a file name.")
+            sys.exit(1)
+        return {reports[0]: filename}
+    extension = OUTPUT_FORMATS[output_format]
+    if not filename:
+        filename = "output" + extension
+    if not filename.endswith(extension):
+        filename += extension
+    if len(reports) == 1:
+        return {reports[0]: filename}
+    base = filename[:-len(extension)]
+    return {report: f"{base}_{REPORTS[report]['name']}{extension}" for report in reports}
+
+#Returns the selected reports grouped by the endpoint they are made from, activity first.
 def report_determiner(args):
-    otherTriggered = False
-    if (args.checkin or args.checkout):
-        if args.checkin:
-            if otherTriggered:
-                print("Multiple reports detected! Please select reports one at a time.")
-                sys.exit()
-            otherTriggered = True
-
-        if args.checkout:
-            if otherTriggered:
-                print("Multiple reports detected! Please select reports one at a time.")
-                sys.exit()
-            otherTriggered = True
-
-        api_url = "*API_URL*/reports/activity"
-        labels = ["id", "name", "action", "datetime"]
-        offset = 0
-        limit = 50
-
-    if args.hardware:
-        if otherTriggered:
-            print("Multiple reports detected! Please select reports one at a time.")
-            sys.exit()
-        otherTriggered = True
-
-        api_url = "*API_URL*/hardware"
-        labels = ["id", "name", "asset_tag", "serial", "model", "status"]
-        offset = 0
-        limit = 500
-        
-    if (args.hardware is False and args.checkin is False and args.checkout is False):
+    selected = [report for report, flag in (("ci", args.checkin), ("co", args.checkout), ("d", args.hardware)) if flag]
+    if not selected:
         print("Please select a report using the arguments (see -h)")
         sys.exit()
-    return offset, limit, labels, api_url
+    groups = {}
+    for report in selected:
+        groups.setdefault(REPORTS[report]["endpoint"], []).append(report)
+    return list(groups.values())
 
-def check_data_in_out(file, writer, data, args, max_save_size):
-    for i in range(max_save_size):
-            if (data["rows"][i]["action_type"] == "checkin from"):
-                if (args.checkin):
-                    save_row(file,writer,data,i, 'ci')
-            if (data["rows"][i]["action_type"] == "checkout"):
-                if (args.checkout):
-                    save_row(file,writer,data,i, 'co')
+#Filters pushed down to the api for a group of reports, each with the check its rows must pass.
+def report_filters(reports):
+    if reports == ['d']:
+        return [({"status": status}, lambda item, meta = meta: item["status_label"]["status_meta"] == meta)
+                for status, meta in HARDWARE_STATUSES]
+    action_types = ["checkin from" if report == 'ci' else "checkout" for report in reports]
+    return [({"action_type": action_type}, lambda item, action_type = action_type: item["action_type"] == action_type) for action_type in action_types]
+
+#Builds the filtered queries for the report and returns (url, total) for each, or None if the api can't be reached.
+#The filters are disjoint, so if their totals add up to more than the unfiltered total, or a returned row fails its check,
+#the server is ignoring them and the report falls back to one unfiltered query. report_rows filters locally either way.
+def report_queries(api_url, headers, total, reports):
+    order = HARDWARE_ORDER if reports == ['d'] else {}
+    unfiltered = (f"{api_url}?{urlencode(order)}" if order else api_url, total)
+    queries = []
+    for params, check in report_filters(reports):
+        query_url = f"{api_url}?{urlencode({**params, **order})}"
+        data = ping_api(page_url(query_url, 0, 1), headers)
+        if not data:
+            return None
+        if not all(check(item) for item in data["rows"]):
+            return [unfiltered]
+        queries.append((query_url, data["total"]))
+    if sum(query_total for _, query_total in queries) > total:
+        return [unfiltered]
+    return queries
+
+#Page generator stage for the check-in/check-out report.
+#Finds the cutoff page up front, then fetches the pages in range and trims the last one locally.
+#With a cache the entries are stored, and once the cache covers the time period only newer entries are downloaded.
+def activity_pages(api_url, headers, total, limit, args):
+    cache = response_cache.get_cache()
+    since = (datetime.now() - timedelta(days=args.timeperiod)).strftime('%Y-%m-%d %H:%M:%S')
+    newest_id = cache.newest_entry_id(api_url, since) if cache is not None else None
+    if newest_id is not None:
+        yield from cached_activity_pages(api_url, headers, total, limit, args, cache, newest_id, since)
+        return
+    fetched = []
+    page_count = count_pages_in_time_period(api_url, headers, total, limit, args.timeperiod)
+    for data in page_fetcher(args)(api_url, headers, range(0, min(page_count * limit, total), limit), limit, args.workers):
+        data = required_page(data)
+        in_range = rows_in_time_period(data, args.timeperiod)
+        yield data["rows"][:in_range]
+        if cache is not None:
+            fetched.extend(data["rows"][:in_range])
+        if in_range < len(data["rows"]):
+            break
+    if cache is not None:
+        cache.add_entries(api_url, fetched, since, replace = True)
+
+#Activity pages when the cache holds every entry of the time period up to newest_id.
+#Pages are read from the newest until one reaches a cached entry, then the cached entries still in the period follow.
+def cached_activity_pages(api_url, headers, total, limit, args, cache, newest_id, since):
+    new_entries = []
+    overlapped = False
+    for offset in range(0, total, limit):
+        data = required_page(ping_api(page_url(api_url, offset, limit), headers))
+        new_entries.extend(row for row in data["rows"] if row["id"] > newest_id)
+        if any(row["id"] <= newest_id for row in data["rows"]):
+            overlapped = True
+            break
+    in_range = rows_in_time_period({"rows": new_entries}, args.timeperiod)
+    yield new_entries[:in_range]
+    if overlapped and in_range == len(new_entries):
+        yield cache.entries(api_url, since)
+    cache.add_entries(api_url, new_entries[:in_range], since, replace = not overlapped)
+
+#Page generator stage for the hardware report.
+#Every offset is known from the total, so the pages are fetched in parallel, on pool from page_pool when given.
+def hardware_pages(api_url, headers, total, limit, args, pool = None):
+    for data in page_fetcher(args)(api_url, headers, range(0, total, limit), limit, args.workers, pool):
+        yield required_page(data)["rows"]
+
+#Merges page streams that are each in HARDWARE_ORDER into pages of up to limit rows, all newest first,
+#so the report keeps the order of one unfiltered pass over the assets. Assets created at the same time go by id.
+def merged_pages(page_streams, limit):
+    rows = heapq.merge(*(chain.from_iterable(pages) for pages in page_streams),
+                       key = lambda item: (item["created_at"]["datetime"], item["id"]), reverse = True)
+    while True:
+        page = list(islice(rows, limit))
+        if not page:
+            return
+        yield page
+
+#Makes a group of reports from one endpoint: finds the queries, then streams every page through each report's sink.
+#Every sink sees every page and report_rows keeps its own rows, so check-ins and check-outs are split from
+#the same pages when the server ignores the filters, and no page is downloaded twice either way.
+def run_reports(reports, headers, filenames, args):
+    report = REPORTS[reports[0]]
+    api_url = f"{API_URL}/{report['endpoint']}"
+
+    #Only the total is needed from the first call, so ask for a single row.
+    data = ping_api(page_url(api_url, 0, 1), headers)
+
+    if not data: #Failure to retrieve data
+        print("Could not retrieve data! Please check that the website is up and that the API key hasn't expired.", file = sys.stderr)
+        sys.exit(1)
+
+    queries = report_queries(api_url, headers, data["total"], reports)
+    if queries is None:
+        print("Could not retrieve data! Please check that the website is up and that the API key hasn't expired.", file = sys.stderr)
+        sys.exit(1)
+
+    #Pages stream through the row transform into the sinks, one page at a time
+    with ExitStack() as streams:
+        if reports == ['d'] and len(queries) > 1:
+            #The status queries are read side by side, so they share one pool to stay within --workers.
+            pool = streams.enter_context(page_pool(args))
+            status_pages = [hardware_pages(query_url, headers, total, report["limit"], args, pool) for query_url, total in queries]
+            for pages in status_pages:
+                streams.callback(pages.close)
+            pages = merged_pages(status_pages, report["limit"])
+        else:
+            report_pages = hardware_pages if reports == ['d'] else activity_pages
+            pages = chain.from_iterable(report_pages(query_url, headers, total, report["limit"], args) for query_url, total in queries)
+        sinks = {}
+        try:
+            for name in reports:
+                sinks[name] = open_sink(filenames[name], args.format, REPORTS[name]["labels"])
+            for items in pages:
+                for name in reports:
+                    sinks[name].write_rows(report_rows(items, name))
+        finally:
+            for sink in sinks.values():
+                sink.close()
+
+#The newest activity entry watch mode has written out, kept in the hidden .tulips_cursor.json file.
+class ActivityCursor(object):
+    """Init Constructor"""
+    def __init__(self, path = CURSOR_FILE, api_url = None, action_id = None, action_date = None):
+        self.path = path
+        self.api_url = api_url
+        self.action_id = action_id
+        self.action_date = action_date
+
+    #Reads the cursor, starting empty if the file is missing, unreadable or from another server.
+    @classmethod
+    def load(cls, api_url, path = CURSOR_FILE):
+        try:
+            with open(path, 'r') as file:
+                data = json.load(file)
+            if data.get('api_url') == api_url:
+                return cls(path, api_url, data.get('id'), data.get('datetime'))
+        except (FileNotFoundError, ValueError, AttributeError):
+            pass
+        return cls(path, api_url)
+
+    def save(self):
+        write_file_atomically(self.path, json.dumps({"api_url": self.api_url, "id": self.action_id, "datetime": self.action_date}))
+
+    def is_new(self, entry):
+        return self.action_id is None or entry["id"] > self.action_id
+
+    def advance(self, entry):
+        self.action_id = entry["id"]
+        self.action_date = entry["action_date"]["datetime"]
+
+#Activity entries newer than the cursor, oldest first, or None if the api couldn't be reached.
+#Usually the newest page reaches the cursor and this is one request, older pages are only read after a burst of activity.
+def poll_activity(api_url, headers, cursor, limit):
+    entries = {}
+    offset = 0
+    while True:
+        data = ping_api(page_url(api_url, offset, limit), headers)
+        if not data:
+            return None
+        for row in data["rows"]:
+            if cursor.is_new(row):
+                entries[row["id"]] = row
+        if len(data["rows"]) < limit or not all(cursor.is_new(row) for row in data["rows"]):
+            break
+        offset += limit
+    return [entries[action_id] for action_id in sorted(entries)]
+
+#Watch mode for the check-in/check-out reports. Polls the activity log every args.watch seconds on the same pooled session
+#and appends new rows to the rolling output files, then moves the cursor on. Runs until interrupted.
+#The cursor is only saved after the rows are flushed, so a crash can repeat rows but never lose them.
+def watch_reports(reports, headers, filenames, args, messages):
+    api_url = f"{API_URL}/{REPORTS[reports[0]]['endpoint']}"
+    limit = REPORTS[reports[0]]["limit"]
+    cursor = ActivityCursor.load(api_url, args.cursor)
+    if cursor.action_id is None:
+        data = ping_api(page_url(api_url, 0, 1), headers)
+        if not data:
+            print("Could not retrieve data! Please check that the website is up and that the API key hasn't expired.", file = sys.stderr)
+            sys.exit(1)
+        if data["rows"]:
+            cursor.advance(data["rows"][0])
+        cursor.save()
+    print(f"Watching for activity after {cursor.action_date or 'now'}, polling every {args.watch} seconds...", file = messages)
+    sinks = {name: open_sink(filenames[name], args.format, REPORTS[name]["labels"]) if filenames[name] == "-" else RollingSink(filenames[name], args.format, REPORTS[name]["labels"])
+             for name in reports}
+    next_poll = time.monotonic()
+    try:
+        while True:
+            entries = poll_activity(api_url, headers, cursor, limit)
+            if entries:
+                for name in reports:
+                    rows = report_rows(entries, name)
+                    sinks[name].write_rows(rows)
+                    sinks[name].flush()
+                    if rows:
+                        print(f"{len(rows)} new {REPORTS[name]['name']} entries", file = messages)
+                cursor.advance(entries[-1])
+                cursor.save()
+            #A poll that ran past the interval is followed straight away, without trying to catch up on the ones missed.
+            next_poll = max(next_poll + args.watch, time.monotonic())
+            time.sleep(max(0, next_poll - time.monotonic()))
+    except KeyboardInterrupt:
+        print("Stopped watching.", file = messages)
+    finally:
+        for sink in sinks.values():
+            sink.close()
 
 def main():
     start_time = time.time()
     #Args init
     args = argument_checker()
     api_key = args.apikey
-    csv_filename = csv_file_check(args.output)
-    offset, sizeIncrease, labels, api_url = report_determiner(args)
+    groups = report_determiner(args)
+    filenames = output_file_check(args.output, args.format, [report for reports in groups for report in reports])
+    #Pages of both endpoints can be in flight at the same time.
+    http_client.configure_session(pool_size = max(args.workers, 1) * len(groups), timeout = args.timeout)
+    if args.cache:
+        #Activity changes all the time, so its pages are always asked for and the entries are cached instead.
+        response_cache.configure_cache(args.cache, args.cache_ttl, args.cache_size * 1024 * 1024, volatile = [f"{API_URL}/reports/activity"])
+    #Keep messages out of the report when it is piped through stdout.
+    messages = sys.stderr if "-" in filenames.values() else sys.stdout
 
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -131,55 +611,31 @@ def main():
         "Content-Type": "application/json"
     }
 
-    data = ping_api(api_url, headers)
-
-    #CSV init
-    file = open(csv_filename,"w",newline='')
-    writer = csv.writer(file)
-    
-    if data:
-        #Main loop
-        print("Saving data...")
-        writer.writerow(labels)
-        total_results = data["total"]
-        second_condition_trigger = False
-
-    else: #Failure to retrieve data
-        print("Could not retrieve data! Please check that the website is up and that the API key hasn't expired.")
-        sys.exit(1)
-     
-    # Iterate until the request size is reduced to 1 or the condition is met
-    if args.checkout or args.checkin:
-        while sizeIncrease > 0:
-            # Create a list of data with the current request size
-            data = ping_api((f"{api_url}?offset={offset}&limit={sizeIncrease}"), headers=headers) # Replace 'get_next_unit' with your data retrieval logic
-
-            if data:
-                last_unit_dt = date_calculations(data,-1)
-                if last_unit_dt < timedelta(days=args.timeperiod) and not second_condition_trigger :
-                    offset = offset + sizeIncrease
-                    check_data_in_out(file, writer, data, args, sizeIncrease)
-                if date_calculations(data,sizeIncrease-1) >= timedelta(days=args.timeperiod):
-                    second_condition_trigger = True
-                    current_unit_dt = date_calculations(data,sizeIncrease-1)
-                    sizeIncrease -=1
-                    if (date_calculations(data,sizeIncrease-2) < timedelta(days=args.timeperiod)):
-                        check_data_in_out(file, writer, data, args, sizeIncrease-1)
-                        break 
-    #check for hardware       
-    elif data and args.hardware:
-        total = data["total"]
-        while offset <= total:
-            data = ping_api((f"{api_url}?offset={offset}&limit={sizeIncrease}"), headers=headers)
-            if data:
-                for i in range(len(data["rows"])):
-                    if (data["rows"][i]["status_label"]["status_meta"] != "deployed" and data["rows"][i]["status_label"]["status_meta"] != "archived"):       
-                        save_row(file,writer,data,i, 'd')
-                offset += sizeIncrease
-            
-    file.close()
-    print(f"Data has been saved to '{csv_filename}'")
-    print("--- Program took %s seconds to execute ---" % (time.time() - start_time))
+    if args.watch:
+        if args.hardware or args.format == "parquet":
+            print("Watch mode only works for the check-in and check-out reports, written as csv, csv.gz or jsonl.")
+            sys.exit(1)
+        watch_reports(groups[0], headers, filenames, args, messages)
+        response_cache.close_cache()
+        http_client.close_session()
+        return
+
+    print("Saving data...", file = messages)
+    if len(groups) == 1:
+        run_reports(groups[0], headers, filenames, args)
+    else:
+        #The activity log and the hardware list are fetched at the same time.
+        with ThreadPoolExecutor(max_workers = len(groups)) as executor:
+            for future in [executor.submit(run_reports, reports, headers, filenames, args) for reports in groups]:
+                future.result()
+
+    for filename in filenames.values():
+        print(f"Data has been saved to '{filename}'", file = messages)
+    cache = response_cache.get_cache()
+    if cache is not None:
+        print(f"Cache: {cache.hits} pages from disk, {cache.revalidated} not modified, {cache.downloaded} downloaded", file = messages)
+        response_cache.close_cache()
+    print("--- Program took %s seconds to execute ---" % (time.time() - start_time), file = messages)
           
 if __name__ == "__main__":
     main()
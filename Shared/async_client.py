@@ -0,0 +1,134 @@
+import asyncio
+import requests
+from collections import deque
+from Shared import http_client
+
+#httpx is optional. Without it requests go through the shared requests session on worker threads,
+#still bounded by the same semaphore, so the async paths work with just the requests package installed.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_CONCURRENCY = 100
+#Methods that are safe to send again after a 5xx, 429 is retried for any method like in http_client.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS", "TRACE"])
+
+#True if the response should be retried, following the same rules as http_client.RateLimitRetry.
+def should_retry(method, status_code):
+    if status_code == 429:
+        return True
+    return status_code in http_client.RETRY_STATUSES and method.upper() in IDEMPOTENT_METHODS
+
+#Seconds to wait before the next attempt: Retry-After when the api sent one, exponential backoff otherwise.
+def retry_delay(response, attempt, backoff):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return backoff * (2 ** attempt)
+
+#Asyncio client shared by every request of a run. At most concurrency requests are in flight at once,
+#and the limiter (a Shared.rate_limit.TokenBucket) caps the requests per second.
+class AsyncClient(object):
+    """Init Constructor"""
+    def __init__(self, concurrency = DEFAULT_CONCURRENCY, timeout = http_client.DEFAULT_TIMEOUT, retries = http_client.DEFAULT_RETRIES,
+                 backoff = http_client.DEFAULT_BACKOFF, limiter = None):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = limiter
+        if httpx is not None:
+            limits = httpx.Limits(max_connections = max(1, concurrency), max_keepalive_connections = max(1, concurrency))
+            self.client = httpx.AsyncClient(timeout = timeout, limits = limits, headers = {"Accept-Encoding": "gzip, deflate"})
+            self.errors = (httpx.HTTPError,)
+        else:
+            #The shared session already retries and rate limits on its own.
+            self.client = None
+            self.session = http_client.get_session()
+            self.errors = (requests.exceptions.RequestException,)
+
+    #Sends a request and returns the response. Both backends' responses have status_code, headers, json() and raise_for_status().
+    async def request(self, method, url, **kwargs):
+        async with self.semaphore:
+            if self.client is None:
+                return await asyncio.to_thread(self.session.request, method, url, **kwargs)
+            return await self.send_with_retries(method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def send_with_retries(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire_async()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.ConnectError:
+                #Nothing reached the server, so this is safe to retry for any method.
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                continue
+            if attempt == self.retries or not should_retry(method, response.status_code):
+                return response
+            if response.status_code == 429 and self.limiter is not None:
+                self.limiter.pause(http_client.RATE_LIMIT_PAUSE)
+            await asyncio.sleep(retry_delay(response, attempt, self.backoff))
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+#Builds a client that shares the rate limiter of the configured http_client session, if it has one.
+def build_client(concurrency = DEFAULT_CONCURRENCY, timeout = http_client.DEFAULT_TIMEOUT):
+    return AsyncClient(concurrency, timeout, limiter = getattr(http_client.get_session(), "limiter", None))
+
+#One event loop and client for several ordered_results generators read side by side. Their requests all
+#wait on the client's semaphore, so together they keep to its concurrency, and every generator's tasks
+#run while the caller waits on any of them.
+class SharedLoop(object):
+    """Init Constructor"""
+    def __init__(self, client):
+        self.loop = asyncio.new_event_loop()
+        self.client = client
+
+    #Closes the client and the loop, once every generator using them is closed.
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.run_until_complete(self.loop.shutdown_default_executor())
+        self.loop.close()
+
+#Runs the coroutines on a private event loop, or on shared's when given, and yields their results in order.
+#At most window coroutines are scheduled at a time, and the loop only runs while the caller waits
+#for the next result, so a slow consumer holds back new requests instead of piling up responses.
+#A private loop and the client are closed once the results run out or the caller stops early, a shared one is left to its owner.
+def ordered_results(coroutines, window, client = None, shared = None):
+    loop = shared.loop if shared is not None else asyncio.new_event_loop()
+    pending = deque()
+    try:
+        for coroutine in coroutines:
+            pending.append(loop.create_task(coroutine))
+            if len(pending) >= window:
+                yield loop.run_until_complete(pending.popleft())
+        while pending:
+            yield loop.run_until_complete(pending.popleft())
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions = True))
+        if shared is None:
+            if client is not None:
+                loop.run_until_complete(client.aclose())
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+#Runs one coroutine to completion on a private event loop, closing the client afterwards.
+def run(coroutine, client = None):
+    async def run_and_close():
+        try:
+            return await coroutine
+        finally:
+            if client is not None:
+                await client.aclose()
+    return asyncio.run(run_and_close())
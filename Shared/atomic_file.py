@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+#Writes text to a temp file next to path and renames it over path,
+#so a crash part way through never leaves a half written file behind.
+#mode sets the file's permissions, mkstemp makes it readable by the owner only.
+def write_file_atomically(path, text, mode = None):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir = directory, prefix = os.path.basename(path) + '.', suffix = '.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
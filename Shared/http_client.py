@@ -0,0 +1,93 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from Shared.rate_limit import TokenBucket
+
+#Defaults shared by every script using the client.
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_PAUSE = 1 #Seconds every thread holds off after a 429.
+RATE_LIMIT_BURST = 10 #Seconds worth of requests that can go out at once before the rate limit kicks in.
+
+_session = None
+_session_lock = threading.Lock()
+
+#Retry policy for the pooled session.
+#A 429 was never processed by the server, so it is safe to retry for any method.
+#Other error statuses are only retried for idempotent methods so a POST is never sent twice.
+class RateLimitRetry(Retry):
+    def is_retry(self, method, status_code, has_retry_after = False):
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+#True if the api answered 429 to the request or to any of its retries.
+def was_rate_limited(response):
+    retries = getattr(response.raw, "retries", None)
+    return response.status_code == 429 or any(entry.status == 429 for entry in (retries.history if retries else ()))
+
+#Session that applies a default timeout to every request made through it.
+#With a limiter, every request waits for a token first and a 429 pauses the limiter for all threads.
+class PooledSession(requests.Session):
+    def __init__(self, timeout = DEFAULT_TIMEOUT, limiter = None):
+        super().__init__()
+        self.timeout = timeout
+        self.limiter = limiter
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if self.limiter is None:
+            return super().request(method, url, **kwargs)
+        self.limiter.acquire()
+        response = super().request(method, url, **kwargs)
+        if was_rate_limited(response):
+            self.limiter.pause(RATE_LIMIT_PAUSE)
+        return response
+
+#Builds a session whose connections are kept alive and reused for up to pool_size requests at once.
+#Failed requests are retried with exponential backoff and Retry-After is respected on 429/503.
+#rate_limit caps the requests per second across every thread using the session.
+def build_session(pool_size = DEFAULT_POOL_SIZE, timeout = DEFAULT_TIMEOUT, retries = DEFAULT_RETRIES, backoff = DEFAULT_BACKOFF, rate_limit = None):
+    session = PooledSession(timeout, TokenBucket(rate_limit, rate_limit * RATE_LIMIT_BURST) if rate_limit else None)
+    retry = RateLimitRetry(
+        total = retries,
+        backoff_factor = backoff,
+        status_forcelist = RETRY_STATUSES,
+        respect_retry_after_header = True,
+        raise_on_status = False #Hand the last response back so raise_for_status reports it.
+    )
+    adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+#Replaces the shared session used by every call in the scripts.
+def configure_session(pool_size = DEFAULT_POOL_SIZE, timeout = DEFAULT_TIMEOUT, retries = DEFAULT_RETRIES, backoff = DEFAULT_BACKOFF, rate_limit = None):
+    global _session
+    session = build_session(pool_size, timeout, retries, backoff, rate_limit)
+    with _session_lock:
+        old_session, _session = _session, session
+    if old_session is not None:
+        old_session.close()
+    return session
+
+#Returns the shared session, building it with the defaults if nothing configured it yet.
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+#Closes the shared session and its pooled connections.
+def close_session():
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
@@ -0,0 +1,151 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from Shared.atomic_file import write_file_atomically
+
+#Upper bounds in seconds of the latency histogram buckets, the last bucket catches everything slower.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+#Counters for one run: timed calls, stages and everything that went over the wire.
+#All updates go through the lock so calls made from worker threads are counted correctly.
+class Metrics(object):
+    """Init Constructor"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.calls = {} #name -> count, failures, seconds, bucket counts
+        self.stages = {} #name -> count, seconds, in the order they first ran
+        self.responses = {} #status code -> count
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+
+    def record_call(self, name, seconds, failed):
+        with self.lock:
+            call = self.calls.setdefault(name, {"count": 0, "failures": 0, "seconds": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)})
+            call["count"] += 1
+            call["failures"] += failed
+            call["seconds"] += seconds
+            call["buckets"][next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))] += 1
+
+    def record_stage(self, name, seconds):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += seconds
+
+    #Response hook for the shared session. Sizes are taken from the wire, so gzip bodies count compressed.
+    #A streamed body without a Content-Length isn't read here, that would load it all, so it counts as 0 bytes.
+    def record_response(self, response, *args, **kwargs):
+        body = response.request.body or b""
+        received = response.headers.get("Content-Length") or (0 if kwargs.get("stream") else None)
+        retries = getattr(response.raw, "retries", None)
+        with self.lock:
+            self.responses[response.status_code] = self.responses.get(response.status_code, 0) + 1
+            self.bytes_sent += len(body.encode() if isinstance(body, str) else body)
+            self.bytes_received += int(received) if received is not None else len(response.content)
+            self.retries += len(retries.history) if retries else 0
+
+    def summary(self):
+        with self.lock:
+            return {
+                "run_seconds": time.time() - self.started,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "calls": {name: dict(call, buckets = dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], call["buckets"])))
+                          for name, call in self.calls.items()},
+                "responses": {str(status): count for status, count in self.responses.items()},
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "retries": self.retries
+            }
+
+    #Prometheus text exposition format, for node_exporter's textfile collector.
+    def prometheus(self, prefix):
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_run_duration_seconds gauge", f"{prefix}_run_duration_seconds {summary['run_seconds']:.6f}",
+                 f"# TYPE {prefix}_stage_duration_seconds gauge"]
+        lines += [f'{prefix}_stage_duration_seconds{{stage="{name}"}} {stage["seconds"]:.6f}' for name, stage in summary["stages"].items()]
+        lines.append(f"# TYPE {prefix}_call_duration_seconds histogram")
+        for name, call in summary["calls"].items():
+            cumulative = 0
+            for bound, count in call["buckets"].items():
+                cumulative += count
+                lines.append(f'{prefix}_call_duration_seconds_bucket{{call="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_call_duration_seconds_sum{{call="{name}"}} {call["seconds"]:.6f}')
+            lines.append(f'{prefix}_call_duration_seconds_count{{call="{name}"}} {call["count"]}')
+        lines.append(f"# TYPE {prefix}_call_failures_total counter")
+        lines += [f'{prefix}_call_failures_total{{call="{name}"}} {call["failures"]}' for name, call in summary["calls"].items()]
+        lines.append(f"# TYPE {prefix}_http_responses_total counter")
+        lines += [f'{prefix}_http_responses_total{{code="{status}"}} {count}' for status, count in summary["responses"].items()]
+        lines += [f"# TYPE {prefix}_http_bytes_total counter",
+                  f'{prefix}_http_bytes_total{{direction="sent"}} {summary["bytes_sent"]}',
+                  f'{prefix}_http_bytes_total{{direction="received"}} {summary["bytes_received"]}',
+                  f"# TYPE {prefix}_http_retries_total counter",
+                  f"{prefix}_http_retries_total {summary['retries']}"]
+        return "\n".join(lines) + "\n"
+
+_metrics = Metrics()
+
+#Returns the metrics of the current run.
+def get_metrics():
+    return _metrics
+
+#Starts a fresh set of metrics, the run time is measured from here.
+def reset():
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+#Counts the bytes, status codes and retries of every response the session receives.
+def install(session):
+    session.hooks["response"].append(lambda response, *args, **kwargs: _metrics.record_response(response, **kwargs))
+    return session
+
+#Times a block of the run as a named stage.
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _metrics.record_stage(name, time.perf_counter() - start)
+
+#Decorator timing each call of an api function, sync or async. A None result is counted as a failure,
+#since the scripts' api functions log the error and return None when a request fails.
+def timed(name):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                result = None
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                finally:
+                    _metrics.record_call(name, time.perf_counter() - start, result is None)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                _metrics.record_call(name, time.perf_counter() - start, result is None)
+        return wrapper
+    return decorator
+
+#Writes the metrics to path, as a Prometheus textfile when it ends in .prom and as json otherwise.
+#The file is swapped in whole so a collector never reads half of it.
+def write(path, prefix):
+    if path.endswith(".prom"):
+        text = _metrics.prometheus(prefix)
+    else:
+        text = json.dumps(_metrics.summary(), indent = 2)
+    write_file_atomically(path, text, 0o644) #Collectors run as another user.
@@ -0,0 +1,123 @@
+import codecs
+import json
+
+#Characters that can follow the part of a number already in the buffer, "" being the end of the buffer.
+NUMBER_CONTINUATION = frozenset(["", ".", "e", "E", "+", "-", *"0123456789"])
+
+#Incremental reader for a JSON document that arrives in chunks, such as response.iter_content().
+#Values are decoded one at a time with json's C decoder, so only the value being read and one chunk are in memory.
+class JsonStream(object):
+    """Init Constructor"""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.finished = False
+
+    #Reads the next chunk into the buffer, dropping what was already parsed. Returns False at the end of the input.
+    def fill(self):
+        if self.finished:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.finished = True
+            text = self.decoder.decode(b"", final = True)
+        else:
+            text = self.decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    #Returns the next character that isn't whitespace without consuming it, or "" at the end of the input.
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    #Decodes the next complete value, reading more chunks until it is all there.
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            #A number cut off by the end of the buffer parses as a shorter number, so read on until something follows it.
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and self.buffer[end:end + 1] in NUMBER_CONTINUATION and self.fill():
+                continue
+            self.pos = end
+            return value
+
+#A sheet response read as a stream. Everything before the rows array (id, columns, totalRowCount...)
+#is parsed up front into header, then rows() yields one row dict at a time.
+#Reads like the parsed dict where the scripts need it: get() for the header and ['rows'] for the rows.
+class SheetStream(object):
+    """Init Constructor"""
+    def __init__(self, chunks):
+        self.stream = JsonStream(chunks)
+        self.header = {}
+        self.in_rows = self.read_header()
+
+    #Parses keys until the rows array starts. Returns False if the sheet has no rows key.
+    def read_header(self):
+        self.stream.expect('{')
+        while self.stream.peek() not in ('}', ''):
+            key = self.stream.value()
+            self.stream.expect(':')
+            if key == 'rows':
+                self.stream.expect('[')
+                return True
+            self.header[key] = self.stream.value()
+            if self.stream.peek() == ',':
+                self.stream.expect(',')
+        return False
+
+    def get(self, key, default = None):
+        return self.header.get(key, default)
+
+    def __getitem__(self, key):
+        if key == 'rows':
+            return self.rows()
+        return self.header[key]
+
+    #Yields the rows as they are parsed. Keys after the rows array are added to header at the end.
+    def rows(self):
+        if not self.in_rows:
+            return
+        self.in_rows = False
+        if self.stream.peek() == ']':
+            self.stream.expect(']')
+        else:
+            while True:
+                yield self.stream.value()
+                if self.stream.peek() != ',':
+                    break
+                self.stream.expect(',')
+            self.stream.expect(']')
+        while self.stream.peek() == ',':
+            self.stream.expect(',')
+            key = self.stream.value()
+            self.stream.expect(':')
+            self.header[key] = self.stream.value()
+        self.stream.expect('}')
+
+    #Reads the whole sheet into the same dict response.json() would give, without keeping the raw text around.
+    def to_dict(self):
+        rows = list(self.rows())
+        data = dict(self.header)
+        data['rows'] = rows
+        return data
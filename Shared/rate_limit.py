@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import time
+
+#Token bucket shared by every thread making calls to one api.
+#Tokens refill at rate per second up to capacity, each call takes one and waits when none are left.
+class TokenBucket(object):
+    """Init Constructor"""
+    def __init__(self, rate, capacity = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    #Takes a token if one is free. Returns 0 when it did, otherwise the seconds until one will be.
+    def try_acquire(self):
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    #Blocks until a token is free and takes it.
+    def acquire(self):
+        wait = self.try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    #Waits for a token without blocking the event loop.
+    async def acquire_async(self):
+        wait = self.try_acquire()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire()
+
+    #Called when the api answered 429, so every thread holds off for seconds instead of piling on more calls.
+    def pause(self, seconds):
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+#Defaults shared by every script using the cache.
+DEFAULT_TTL = 3600 #Seconds a page is served from disk without asking the api.
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 #Bytes of page bodies kept before the least recently used are dropped.
+
+_cache = None
+_cache_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    digest TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feeds (
+    feed TEXT PRIMARY KEY,
+    complete_since TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    feed TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    action_date TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (feed, id)
+);
+"""
+
+#A page read back from the cache.
+class CachedPage(object):
+    __slots__ = ("etag", "last_modified", "digest", "body", "stored_at")
+    """Init Constructor"""
+    def __init__(self, etag, last_modified, digest, body, stored_at):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.body = body
+        self.stored_at = stored_at
+
+#On-disk cache of GET responses in one SQLite file, safe to share between threads.
+#Pages are keyed by their full url, so endpoint, filters, offset and limit all tell them apart.
+#A page younger than ttl is served without a request, an older one is revalidated with If-None-Match/If-Modified-Since
+#when the api sent an ETag or Last-Modified, and downloaded again otherwise.
+#Urls starting with one of the volatile prefixes change all the time, so they are always revalidated.
+#Activity style logs are kept as entries instead, see newest_entry_id and add_entries.
+class ResponseCache(object):
+    """Init Constructor"""
+    def __init__(self, path, ttl = DEFAULT_TTL, max_size = DEFAULT_MAX_SIZE, volatile = ()):
+        self.path = path
+        self.ttl = ttl
+        self.volatile = tuple(volatile)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+        self.hits = 0 #Pages served from disk without a request.
+        self.revalidated = 0 #Pages the api answered 304 Not Modified for.
+        self.downloaded = 0 #Pages downloaded in full.
+
+    def lookup(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT etag, last_modified, digest, body, stored_at FROM pages WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, digest, body, stored_at = row
+        return CachedPage(etag, last_modified, digest, zlib.decompress(body), stored_at)
+
+    def ttl_for(self, key):
+        return 0 if key.startswith(self.volatile) else self.ttl
+
+    #Works out what a GET of url needs. Returns (page, body, headers): body is set when the page can be served
+    #from disk as it is, otherwise headers are the ones to send, with the conditional headers for a stale page.
+    def prepare(self, url, headers):
+        page = self.lookup(url)
+        if page is None:
+            return None, None, headers
+        now = time.time()
+        if now - page.stored_at < self.ttl_for(url):
+            self.hits += 1
+            with self.lock:
+                self.connection.execute("UPDATE pages SET used_at = ? WHERE key = ?", (now, url))
+            return page, page.body, headers
+        conditional = dict(headers)
+        if page.etag:
+            conditional["If-None-Match"] = page.etag
+        if page.last_modified:
+            conditional["If-Modified-Since"] = page.last_modified
+        return page, None, conditional
+
+    #Handles the response to a request built by prepare and returns the body to use.
+    #Raises like raise_for_status on an error response, which is never cached.
+    def finish(self, url, page, response):
+        if response.status_code == 304 and page is not None:
+            self.revalidated += 1
+            now = time.time()
+            with self.lock:
+                self.connection.execute("UPDATE pages SET stored_at = ?, used_at = ? WHERE key = ?", (now, now, url))
+            return page.body
+        response.raise_for_status()
+        self.downloaded += 1
+        self.store(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"), page)
+        return response.content
+
+    #Stores a body, unless there is no way to reuse it: no validators to revalidate with and a ttl of 0.
+    #An unchanged body (same content hash) only has its times and validators updated.
+    def store(self, key, body, etag = None, last_modified = None, page = None):
+        if not (etag or last_modified or self.ttl_for(key) > 0):
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        now = time.time()
+        with self.lock:
+            if page is not None and page.digest == digest:
+                self.connection.execute("UPDATE pages SET etag = ?, last_modified = ?, stored_at = ?, used_at = ? WHERE key = ?",
+                                        (etag, last_modified, now, now, key))
+                return
+            compressed = zlib.compress(body)
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (key, etag, last_modified, digest, compressed, len(compressed), now, now))
+
+    #GET through the cache with a requests session, returns the body bytes.
+    def fetch(self, session, url, headers):
+        page, body, request_headers = self.prepare(url, headers)
+        if body is not None:
+            return body
+        return self.finish(url, page, session.get(url, headers = request_headers))
+
+    #Same as fetch with a Shared.async_client.AsyncClient.
+    async def fetch_async(self, client, url, headers):
+        page, body, request_headers = self.prepare(url, headers)
+        if body is not None:
+            return body
+        return self.finish(url, page, await client.get(url, headers = request_headers))
+
+    #Id of the newest stored entry of a feed, or None if nothing is stored from complete_since on.
+    #complete_since is an action_date string, every entry of the feed since then must be in the cache for it to be used.
+    def newest_entry_id(self, feed, complete_since):
+        with self.lock:
+            row = self.connection.execute("SELECT complete_since FROM feeds WHERE feed = ?", (feed,)).fetchone()
+            if row is None or row[0] > complete_since:
+                return None
+            return self.connection.execute("SELECT MAX(id) FROM entries WHERE feed = ?", (feed,)).fetchone()[0]
+
+    #Stores entries of a feed and records that every entry since complete_since is now stored.
+    #Entries older than complete_since are dropped, and replace clears the feed first when the new entries don't join up with it.
+    def add_entries(self, feed, entries, complete_since, replace = False):
+        rows = [(feed, entry["id"], entry["action_date"]["datetime"], json.dumps(entry)) for entry in entries]
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                if replace:
+                    self.connection.execute("DELETE FROM entries WHERE feed = ?", (feed,))
+                self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows)
+                self.connection.execute("DELETE FROM entries WHERE feed = ? AND action_date <= ?", (feed, complete_since))
+                self.connection.execute("INSERT OR REPLACE INTO feeds VALUES (?, ?)", (feed, complete_since))
+
+    #Stored entries of a feed newer than since, newest first like the api returns them.
+    def entries(self, feed, since):
+        with self.lock:
+            rows = self.connection.execute("SELECT body FROM entries WHERE feed = ? AND action_date > ? ORDER BY id DESC", (feed, since)).fetchall()
+        return [json.loads(body) for body, in rows]
+
+    #Drops pages that can't be used again (past the ttl with nothing to revalidate with),
+    #then the least recently used pages until the bodies fit in max_size.
+    def evict(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM pages WHERE etag IS NULL AND last_modified IS NULL AND stored_at <= ?", (time.time() - self.ttl,))
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total <= self.max_size:
+                return
+            doomed = []
+            for key, size in self.connection.execute("SELECT key, size FROM pages ORDER BY used_at"):
+                if total <= self.max_size:
+                    break
+                doomed.append((key,))
+                total -= size
+            self.connection.executemany("DELETE FROM pages WHERE key = ?", doomed)
+
+    #Evicts and closes the database.
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.connection.close()
+
+#Opens the shared cache used by every call in the scripts.
+def configure_cache(path, ttl = DEFAULT_TTL, max_size = DEFAULT_MAX_SIZE, volatile = ()):
+    global _cache
+    cache = ResponseCache(path, ttl, max_size, volatile)
+    with _cache_lock:
+        old_cache, _cache = _cache, cache
+    if old_cache is not None:
+        old_cache.close()
+    return cache
+
+#Returns the shared cache, or None when the script runs without one.
+def get_cache():
+    with _cache_lock:
+        return _cache
+
+#Evicts and closes the shared cache.
+def close_cache():
+    global _cache
+    with _cache_lock:
+        cache, _cache = _cache, None
+    if cache is not None:
+        cache.close()